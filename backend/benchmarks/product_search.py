@@ -0,0 +1,132 @@
+"""
+Benchmark: product search (GET /products/search)
+
+Compares shipping the filtered catalog to the client and matching/faceting it
+there (what the shop page has to do without a search endpoint) with the single
+$text + $facet aggregation in search_products.
+
+Needs a real MongoDB. Data goes into a scratch database that is dropped first:
+
+    cd backend
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/product_search.py --products 100000
+
+No results have been recorded yet, so nothing says the aggregation is the
+faster of the two. Client-side matching is substring-based and the text
+index stems words, so hit counts differ; compare latencies, not totals.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "solarsavers_bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+db = server.db
+
+BRANDS = ["SunPower", "Canadian Solar", "First Solar", "JinkoSolar", "SolarTech", "Trina Solar", "LG Solar",
+          "Waaree", "Adani Solar", "Vikram Solar", "Tata Power Solar", "Luminous"]
+PANELS = ["Monocrystalline", "Polycrystalline", "Bifacial", "Thin-Film", "PERC", "Half-Cut"]
+SETUPS = ["Rooftop", "Ground Mount", "Carport", "Hybrid", "On-Grid", "Off-Grid"]
+FEATURES = ["Net Metering", "Battery Backup", "Smart Monitoring", "25 Year Warranty", "Free Installation",
+            "Micro Inverters", "Weatherproof", "Subsidy Assistance", "EMI Available", "AMC Included"]
+QUERIES = ["bifacial", "monocrystalline rooftop", "battery backup", "jinkosolar", "off-grid hybrid",
+           "smart monitoring", "thin-film ground mount", "perc carport", "waaree", "net metering"]
+
+
+async def seed(products: int):
+    await server.client.drop_database(db.name)
+    now = datetime.now(timezone.utc)
+    batch = []
+    for i in range(products):
+        brand = random.choice(BRANDS)
+        panel, setup = random.choice(PANELS), random.choice(SETUPS)
+        size = round(random.choice([2, 3, 5, 8, 10, 15, 25, 50, 100, 250]) * random.uniform(0.8, 1.2), 1)
+        batch.append({
+            "id": str(uuid.uuid4()), "vendor_id": "bench", "vendor_name": "Bench",
+            "name": f"{brand} {size}kW {panel} {setup} System",
+            "description": f"{panel} {setup.lower()} solar system by {brand} for "
+                           f"{'homes' if size < 15 else 'businesses'}, model {i}.",
+            "category": "home" if size < 15 else "commercial",
+            "system_size_kw": size, "price": round(size * random.uniform(45000, 70000)),
+            "efficiency_rating": round(random.uniform(17, 23), 1), "warranty_years": random.choice([10, 20, 25]),
+            "brand": brand, "image_url": "", "features": random.sample(FEATURES, 4),
+            "in_stock": random.random() > 0.1, "rating": round(random.uniform(3.5, 5), 1), "review_count": 0,
+            "created_at": (now - timedelta(minutes=i)).isoformat(),
+        })
+        if len(batch) == 10000:
+            await db.products.insert_many(batch)
+            batch = []
+    if batch:
+        await db.products.insert_many(batch)
+    await server.ensure_indexes()
+
+
+def _bucket(value: float, bounds: list) -> float:
+    return max(b for b in bounds if b <= value)
+
+
+async def client_side_search(q: str, filters: dict) -> dict:
+    """Fetch every filtered product and match/facet in the caller, as the browser would"""
+    products = await db.products.find(filters, {"_id": 0}).to_list(None)
+    terms = q.lower().split()
+    hits = [
+        p for p in products
+        if any(t in f"{p['name']} {p['description']} {p['brand']} {' '.join(p['features'])}".lower() for t in terms)
+    ]
+    return {
+        "results": hits[:20],
+        "total": len(hits),
+        "brand": Counter(p["brand"] for p in hits),
+        "category": Counter(p["category"] for p in hits),
+        "size": Counter(_bucket(p["system_size_kw"], server.SEARCH_SIZE_BUCKETS_KW) for p in hits),
+        "price": Counter(_bucket(p["price"], server.SEARCH_PRICE_BUCKETS) for p in hits),
+    }
+
+
+async def timed(fn, cases: list) -> list:
+    samples = []
+    for q, filters in cases:
+        started = time.perf_counter()
+        await fn(q, filters)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<12} mean {statistics.mean(samples):8.2f} ms   p50 {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.products} products into {db.name}...")
+    await seed(args.products)
+    cases = [
+        (random.choice(QUERIES), random.choice([{}, {"category": "home"}, {"in_stock": True}]))
+        for _ in range(args.runs)
+    ]
+
+    sample = await server.search_products(*cases[0])
+    print(f"Sample query {cases[0][0]!r}: {sample.total} matches, {len(sample.facets.brand)} brand facets")
+    report("client-side", await timed(client_side_search, cases))
+    report("search", await timed(lambda q, filters: server.search_products(q, filters), cases))
+    await server.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+Benchmark: list endpoint serialization
+
+Per-request CPU for a product, order and blog list of 50, 500 and 5000 items,
+served the old way (build response models, let FastAPI validate them again
+through response_model and encode with stdlib json) and through trusted_json.
+The database is left out: both routes serve the same in-memory documents, so
+the difference is serialization alone.
+
+    cd backend
+    python benchmarks/serialization.py --runs 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "solarsavers_bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import server  # noqa: E402
+
+SIZES = [50, 500, 5000]
+NOW = datetime.now(timezone.utc)
+
+
+def product(i: int) -> dict:
+    size = random.choice([3, 5, 8, 10, 25])
+    return {
+        "id": str(uuid.uuid4()), "vendor_id": str(uuid.uuid4()), "vendor_name": "Bench Solar",
+        "name": f"Home {size}kW Solar System {i}", "description": "Monocrystalline rooftop system. " * 8,
+        "category": "home", "system_size_kw": float(size), "price": size * 52000.0, "original_price": size * 60000.0,
+        "efficiency_rating": 21.5, "warranty_years": 25, "brand": "SunPower", "image_url": "https://example.com/p.jpg",
+        "features": ["Net Metering", "Smart Monitoring", "25 Year Warranty", "Free Installation"],
+        "in_stock": True, "rating": 4.6, "review_count": 12,
+        "rating_histogram": {"1": 0, "2": 1, "3": 1, "4": 4, "5": 6},
+        "created_at": (NOW - timedelta(minutes=i)).isoformat(),
+    }
+
+
+def order(i: int) -> dict:
+    items = [
+        {"product_id": str(uuid.uuid4()), "vendor_id": str(uuid.uuid4()), "name": f"Home 5kW System {n}",
+         "price": 260000.0, "quantity": 1}
+        for n in range(3)
+    ]
+    return {
+        "id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "items": items, "total_amount": 780000.0,
+        "status": "pending", "shipping_address": "12 MG Road, Bengaluru 560001",
+        "created_at": (NOW - timedelta(minutes=i)).isoformat(),
+    }
+
+
+def blog(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()), "title": f"Going solar, part {i}", "content": "Net metering explained. " * 200,
+        "excerpt": "Net metering explained.", "category": "guides", "image_url": "https://example.com/b.jpg",
+        "tags": ["solar", "savings"], "author_id": str(uuid.uuid4()), "author_name": "Admin", "is_published": True,
+        "views": 40, "created_at": (NOW - timedelta(minutes=i)).isoformat(), "updated_at": NOW.isoformat(),
+    }
+
+
+CASES = {
+    "products": (server.ProductResponse, product),
+    "orders": (server.OrderResponse, order),
+    "blogs": (server.BlogResponse, blog),
+}
+
+
+def bench_app(docs: dict) -> FastAPI:
+    app = FastAPI()
+    for name, (model, _) in CASES.items():
+        def before(name=name, model=model):
+            return [model(**d) for d in docs[name]]
+
+        def after(name=name, model=model):
+            return server.json_list_response(server.trusted_json(model, docs[name]))
+
+        app.add_api_route(f"/before/{name}", before, response_model=List[model], response_class=JSONResponse)
+        app.add_api_route(f"/after/{name}", after, response_model=List[model])
+    return app
+
+
+async def cpu_per_request(client: httpx.AsyncClient, path: str, runs: int) -> float:
+    await client.get(path)  # warm up adapters and caches
+    started = time.process_time()
+    for _ in range(runs):
+        response = await client.get(path)
+        response.raise_for_status()
+    return (time.process_time() - started) * 1000 / runs
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'list':<10}{'items':>7}{'before ms':>12}{'after ms':>11}{'speedup':>10}")
+    for size in SIZES:
+        docs = {name: [make(i) for i in range(size)] for name, (_, make) in CASES.items()}
+        transport = httpx.ASGITransport(app=bench_app(docs))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in CASES:
+                before = await cpu_per_request(client, f"/before/{name}", args.runs)
+                after = await cpu_per_request(client, f"/after/{name}", args.runs)
+                print(f"{name:<10}{size:>7}{before:>12.2f}{after:>11.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
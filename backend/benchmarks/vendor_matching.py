@@ -0,0 +1,122 @@
+"""
+Benchmark: order-to-vendor matching (GET /admin/orders/{id}/available-vendors)
+
+Compares the previous approach (fetch up to 500 inventory rows, group in Python,
+one users lookup per candidate) with the aggregation in match_vendors_for_order.
+
+Needs a real MongoDB. Data goes into a scratch database that is dropped first:
+
+    cd backend
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/vendor_matching.py --vendors 10000 --rows 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "solarsavers_bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+db = server.db
+
+
+async def seed(vendors: int, rows: int, products: int):
+    await server.client.drop_database(db.name)
+    product_ids = [str(uuid.uuid4()) for _ in range(products)]
+    vendor_ids = [str(uuid.uuid4()) for _ in range(vendors)]
+    await db.users.insert_many([
+        {"id": vid, "email": f"vendor{i}@bench.test", "name": f"Vendor {i}", "role": "vendor",
+         "business_name": f"Bench Solar {i}", "location": random.choice(["pune", "delhi", "mumbai"]),
+         "status": "approved" if random.random() > 0.05 else "pending"}
+        for i, vid in enumerate(vendor_ids)
+    ])
+    per_vendor = max(1, rows // vendors)
+    batch = []
+    for vid in vendor_ids:
+        for pid in random.sample(product_ids, min(per_vendor, products)):
+            batch.append({
+                "id": str(uuid.uuid4()), "vendor_id": vid, "product_id": pid,
+                "quantity": random.randint(0, 20), "vendor_price": random.randint(5000, 100000),
+                "is_available": random.random() > 0.1, "location": None,
+            })
+            if len(batch) == 10000:
+                await db.vendor_inventory.insert_many(batch)
+                batch = []
+    if batch:
+        await db.vendor_inventory.insert_many(batch)
+    await server.ensure_indexes()
+    return product_ids
+
+
+async def legacy_match(order: dict) -> list:
+    """The pre-aggregation implementation, kept here for comparison"""
+    product_ids = [item["product_id"] for item in order.get("items", [])]
+    vendor_inventory = await db.vendor_inventory.find(
+        {"product_id": {"$in": product_ids}, "is_available": True, "quantity": {"$gt": 0}},
+        {"_id": 0}
+    ).to_list(500)
+    vendor_products = {}
+    for inv in vendor_inventory:
+        data = vendor_products.setdefault(inv["vendor_id"], {"products": [], "total_price": 0})
+        data["products"].append(inv["product_id"])
+        for item in order["items"]:
+            if item["product_id"] == inv["product_id"]:
+                data["total_price"] += inv["vendor_price"] * item["quantity"]
+    available = []
+    for vid, data in vendor_products.items():
+        if all(pid in data["products"] for pid in product_ids):
+            vendor = await db.users.find_one({"id": vid}, {"_id": 0, "password": 0})
+            if vendor:
+                available.append({"vendor_id": vid, "total_vendor_price": data["total_price"]})
+    available.sort(key=lambda x: x["total_vendor_price"])
+    return available
+
+
+async def timed(fn, orders: list) -> list:
+    samples = []
+    for order in orders:
+        started = time.perf_counter()
+        await fn(order)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<12} mean {statistics.mean(samples):8.2f} ms   p50 {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vendors", type=int, default=10000)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=3, help="products per order")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.vendors} vendors / {args.rows} inventory rows into {db.name}...")
+    product_ids = await seed(args.vendors, args.rows, args.products)
+    orders = [
+        {"items": [{"product_id": pid, "quantity": random.randint(1, 3)}
+                   for pid in random.sample(product_ids, args.lines)]}
+        for _ in range(args.runs)
+    ]
+
+    matched = await server.match_vendors_for_order(orders[0], 20)
+    print(f"Sample order: {len(matched)} vendors returned (top 20)")
+    report("legacy", await timed(legacy_match, orders))
+    report("aggregation", await timed(lambda order: server.match_vendors_for_order(order, 20), orders))
+    await server.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,37 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteMany, ReplaceOne, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError
 import os
+import io
+import csv
+import sys
+import json
+import orjson
+import re
+import base64
+import time
+import asyncio
 import logging
+import threading
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter
 from typing import List, Optional
 import uuid
+import hashlib
+import functools
+from collections import OrderedDict, deque
+from email.utils import format_datetime, parsedate_to_datetime
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 import jwt
 import bcrypt
+import httpx
+import numpy as np
 
 # Optional LLM import - fallback if not available
 LLM_AVAILABLE = False
@@ -21,23 +41,159 @@ try:
 except ImportError:
     logging.warning("emergentintegrations not installed - AI chat will use fallback responses")
 
+# Optional litellm import - token-streaming chat provider
+LITELLM_AVAILABLE = False
+try:
+    import litellm
+    LITELLM_AVAILABLE = True
+except ImportError:
+    pass
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ============== INSTRUMENTATION ==============
+
+# Latency bucket upper bounds in seconds, shared by request and Mongo histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class LatencyHistogram:
+    """Counts per latency bucket plus sum and count, as a Prometheus histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self) -> list:
+        """(le, count) pairs ending with +Inf, as Prometheus expects"""
+        total, pairs = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((str(bound), total))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Per-collection command counts and durations from pymongo command monitoring.
+
+    Motor runs pymongo on worker threads, so these callbacks are not on the event
+    loop and share state under a lock. Started events carry the command (and so the
+    collection), completion events only the request id, hence the pending map.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.failures = {}
+        self.durations = {}
+
+    def started(self, event):
+        # Most commands name their collection as the command's value; getMore's value is the cursor id
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        target = event.command.get(key)
+        collection = target if isinstance(target, str) else ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, failed: bool):
+        key = (event.connection_id, event.request_id)
+        with self._lock:
+            labels = (self._pending.pop(key, ""), event.command_name)
+            if labels not in self.durations:
+                self.durations[labels] = LatencyHistogram()
+                self.failures[labels] = 0
+            self.durations[labels].observe(event.duration_micros / 1e6)
+            if failed:
+                self.failures[labels] += 1
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+mongo_command_metrics = MongoCommandMetrics()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_command_metrics])
 db = client[os.environ['DB_NAME']]
 
+# Multi-document transactions need a replica set or sharded cluster: auto, on, off
+MONGO_TRANSACTIONS = os.environ.get('MONGO_TRANSACTIONS', 'auto')
+
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'fallback_secret')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Password hashing runs on a bounded pool so bcrypt never blocks the event loop
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')  # thread, process
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '32'))
+PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', '1'))
+
+# Principal cache: users resolved from a token are reused for a short TTL
+PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', '10000'))
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', '60'))
+# Read-only routes may trust the role claim in the token and skip the user lookup
+TRUST_TOKEN_ROLES = os.environ.get('TRUST_TOKEN_ROLES', 'false').lower() == 'true'
+
+# Catalog cache: serialized anonymous product/brand reads, dropped on product writes
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', '2000'))
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+# Cache-Control max-age for public catalog and blog reads; clients revalidate with ETag after it
+HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', '60'))
+
 # LLM Settings
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
-
-app = FastAPI(title="SolarSavers API")
+# Streaming chat through litellm: any model litellm supports, optionally behind an OpenAI-compatible gateway
+CHAT_API_KEY = os.environ.get('CHAT_API_KEY') or os.environ.get('OPENAI_API_KEY')
+CHAT_API_BASE = os.environ.get('CHAT_API_BASE')
+CHAT_MODEL = os.environ.get('CHAT_MODEL', 'gpt-4')
+# Chat replies: litellm (streams tokens), llm (emergentintegrations, whole replies), or stub
+# (keyword answers, no network; for tests). Defaults to the first one that is configured
+CHAT_PROVIDER = os.environ.get('CHAT_PROVIDER', (
+    'litellm' if LITELLM_AVAILABLE and CHAT_API_KEY
+    else 'llm' if LLM_AVAILABLE and EMERGENT_LLM_KEY
+    else 'stub'
+))
+CHAT_TIMEOUT = float(os.environ.get('CHAT_TIMEOUT', '30'))
+# LLM chat sessions (and their own history) are reused per session_id from a bounded pool
+CHAT_SESSION_POOL_SIZE = int(os.environ.get('CHAT_SESSION_POOL_SIZE', '500'))
+CHAT_SESSION_TTL = float(os.environ.get('CHAT_SESSION_TTL', '1800'))
+# Optional JSON file replacing the built-in FAQ table used for keyword answers
+CHAT_FAQ_PATH = os.environ.get('CHAT_FAQ_PATH')
+# Answers keyed by normalized question, so repeated questions skip the LLM
+CHAT_ANSWER_CACHE_SIZE = int(os.environ.get('CHAT_ANSWER_CACHE_SIZE', '5000'))
+CHAT_ANSWER_CACHE_TTL = float(os.environ.get('CHAT_ANSWER_CACHE_TTL', '3600'))
+# Conversation context: recent turns sent verbatim, older ones folded into a capped summary
+CHAT_CONTEXT_TURNS = int(os.environ.get('CHAT_CONTEXT_TURNS', '6'))
+CHAT_CONTEXT_SUMMARY_CHARS = int(os.environ.get('CHAT_CONTEXT_SUMMARY_CHARS', '600'))
+CHAT_CONTEXT_SESSIONS = int(os.environ.get('CHAT_CONTEXT_SESSIONS', '2000'))
+CHAT_CONTEXT_TTL = float(os.environ.get('CHAT_CONTEXT_TTL', '1800'))
+
+# Chat history: buffered (write-behind, batched insert_many) or sync (insert per message)
+CHAT_HISTORY_WRITE_MODE = os.environ.get('CHAT_HISTORY_WRITE_MODE', 'buffered')
+CHAT_HISTORY_BATCH_SIZE = int(os.environ.get('CHAT_HISTORY_BATCH_SIZE', '100'))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.environ.get('CHAT_HISTORY_FLUSH_INTERVAL', '1.0'))
+CHAT_HISTORY_MAX_PENDING = int(os.environ.get('CHAT_HISTORY_MAX_PENDING', '10000'))
+# Blog views are counted in memory and written as one bulk $inc this often (seconds)
+BLOG_VIEW_FLUSH_INTERVAL = float(os.environ.get('BLOG_VIEW_FLUSH_INTERVAL', '5'))
+# When set, GET /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+app = FastAPI(title="SolarSavers API", default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
@@ -114,6 +270,28 @@ class ProductResponse(ProductBase):
     vendor_name: str
     rating: float = 4.5
     review_count: int = 0
+    rating_histogram: Optional[dict] = None  # {"1": count, ..., "5": count}
+    created_at: str
+
+class ProductSummary(BaseModel):
+    """What a product card and the compare page need; the full document is on /products/{id}"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    vendor_id: str
+    vendor_name: str
+    name: str
+    category: str
+    system_size_kw: float
+    price: float
+    original_price: Optional[float] = None
+    efficiency_rating: float
+    warranty_years: int
+    brand: str
+    image_url: str
+    features: List[str] = []
+    in_stock: bool = True
+    rating: float = 4.5
+    review_count: int = 0
     created_at: str
 
 class ProductUpdate(BaseModel):
@@ -122,6 +300,29 @@ class ProductUpdate(BaseModel):
     price: Optional[float] = None
     in_stock: Optional[bool] = None
 
+class ProductSearchHit(ProductResponse):
+    score: Optional[float] = None  # text relevance, absent when searching without `q`
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class RangeFacetCount(BaseModel):
+    min: float
+    max: Optional[float] = None  # None for the open-ended top bucket
+    count: int
+
+class ProductSearchFacets(BaseModel):
+    brand: List[FacetCount]
+    category: List[FacetCount]
+    system_size_kw: List[RangeFacetCount]
+    price: List[RangeFacetCount]
+
+class ProductSearchResponse(BaseModel):
+    results: List[ProductSearchHit]
+    total: int
+    facets: ProductSearchFacets
+
 # ============== MVSP (Multi-Vendor Single Product) MODELS ==============
 
 class VendorInventoryCreate(BaseModel):
@@ -182,7 +383,7 @@ class SolarCalculatorResult(BaseModel):
 
 class CartItem(BaseModel):
     product_id: str
-    quantity: int = 1
+    quantity: int = Field(1, gt=0)
 
 class OrderCreate(BaseModel):
     items: List[CartItem]
@@ -202,6 +403,17 @@ class OrderResponse(BaseModel):
     assigned_at: Optional[str] = None
     created_at: str
 
+class OrderSummary(BaseModel):
+    """Order list row: totals plus each line's product and quantity"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    user_id: str
+    items: List[dict]  # product_id, name, quantity only
+    total_amount: float
+    status: str
+    assigned_vendor_id: Optional[str] = None
+    created_at: str
+
 class ChatMessage(BaseModel):
     message: str
     session_id: Optional[str] = None
@@ -233,7 +445,7 @@ class TicketCreate(BaseModel):
 class TicketReply(BaseModel):
     message: str
 
-class TicketResponse(BaseModel):
+class TicketSummary(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
     user_id: str
@@ -245,12 +457,31 @@ class TicketResponse(BaseModel):
     status: str  # open, in_progress, resolved, closed
     priority: str  # low, medium, high
     order_id: Optional[str] = None
-    replies: List[dict] = []
+    reply_count: int = 0
+    last_reply_at: Optional[str] = None
     created_at: str
     updated_at: str
 
+class TicketResponse(TicketSummary):
+    replies: List[dict] = []  # first page of the thread, oldest first; more via /tickets/{id}/replies
+
 # ============== BLOG MODELS ==============
 
+class BlogSummary(BaseModel):
+    """Blog card: everything but the post body"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    title: str
+    excerpt: str
+    category: str
+    image_url: str
+    tags: List[str]
+    author_name: str
+    is_published: bool
+    views: int = 0
+    created_at: str
+    updated_at: str
+
 class BlogCreate(BaseModel):
     title: str
     content: str
@@ -285,13 +516,401 @@ class BlogResponse(BaseModel):
     created_at: str
     updated_at: str
 
+# ============== CACHES ==============
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Store `value`; `ttl` overrides the cache-wide lifetime for this entry"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def discard_where(self, predicate) -> int:
+        """Drop every entry whose key matches `predicate`"""
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+# User documents (without password) keyed by user id. Invalidation is per
+# process, so with several workers a change is visible everywhere within the TTL.
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+def invalidate_principal(user_id: str):
+    """Call after any write to a user document"""
+    principal_cache.pop(user_id)
+
+# Storefront catalog responses as (JSON bytes, headers), keyed by route and
+# normalized query params: ("product", id), ("products", ...), ("featured", ...), ("brands",)
+catalog_cache = TTLCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+# Bumped on every invalidation so a read that raced a write never caches its stale result
+catalog_generation = 0
+
+def invalidate_catalog(product_id: Optional[str] = None):
+    """Call after any write to a product document.
+
+    Drops that product and every cached list (a write can move a product into or
+    out of any filter); without a product id the whole catalog is dropped.
+    """
+    global catalog_generation
+    catalog_generation += 1
+    if product_id is None:
+        catalog_cache.clear()
+        return
+    catalog_cache.pop(("product", product_id))
+    catalog_cache.discard_where(lambda key: key[0] != "product")
+
+async def cached_catalog_response(request: Request, key: tuple, build) -> Response:
+    """Serve `key` from the catalog cache, calling `build()` -> (bytes, headers) on a miss"""
+    cached = catalog_cache.get(key)
+    if cached is None:
+        generation = catalog_generation
+        body, headers = await build()
+        cached = (body, {**headers, "ETag": body_etag(body)})
+        if generation == catalog_generation:
+            catalog_cache.set(key, cached)
+    body, headers = cached
+    return conditional_response(request, body, headers)
+
+# ============== HTTP CACHING ==============
+
+# Public reads carry an ETag (a hash of the body unless the route supplies one)
+# and, for single documents, Last-Modified from the document's updated_at.
+# Lists get no Last-Modified: deleting an item can make the newest remaining
+# timestamp older, which would wrongly satisfy If-Modified-Since.
+
+def body_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def http_date(timestamp: Optional[str]) -> Optional[str]:
+    """ISO timestamp as stored on documents -> HTTP date, or None if absent/unparseable"""
+    if not timestamp:
+        return None
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored whenever If-None-Match is present
+        return etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = headers.get("Last-Modified")
+    if not (if_modified_since and last_modified):
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+def conditional_response(request: Request, body: bytes, headers: dict) -> Response:
+    """JSON response for a public read, or an empty 304 if the client's copy is current"""
+    headers = {**headers, "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}"}
+    headers.setdefault("ETag", body_etag(body))
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ============== PAGINATION ==============
+
+# List endpoints page by an opaque cursor over (sort field, id). The cursor for
+# the next page comes back in this header so list bodies stay plain arrays.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(sort_value, doc_id: str) -> str:
+    raw = json.dumps([sort_value, doc_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """(sort_value, doc_id) from a cursor; anything else, such as an operator
+    object smuggled in as a value, is rejected before it reaches a query"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        payload = None
+    if not (
+        isinstance(payload, list) and len(payload) == 2
+        and isinstance(payload[0], (str, int, float)) and not isinstance(payload[0], bool)
+        and isinstance(payload[1], str)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return payload[0], payload[1]
+
+def keyset_query(query: dict, sort_field: str, direction: int, cursor: Optional[str]) -> dict:
+    """Narrow `query` to documents that come after `cursor` in (sort_field, id) order"""
+    if not cursor:
+        return query
+    sort_value, doc_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    after = {"$or": [{sort_field: {op: sort_value}}, {sort_field: sort_value, "id": {op: doc_id}}]}
+    return {"$and": [query, after]} if query else after
+
+def keyset_sort(sort_field: str, direction: int) -> list:
+    return [(sort_field, direction), ("id", direction)]
+
+def set_next_cursor(response: Response, docs: list, limit: int, sort_field: str) -> list:
+    """Trim a limit+1 fetch to `limit` and advertise the next cursor if there is more"""
+    if len(docs) <= limit:
+        return docs
+    docs = docs[:limit]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1].get(sort_field), docs[-1]["id"])
+    return docs
+
+async def fetch_page(
+    collection, query: dict, projection: dict, sort_field: str, direction: int,
+    limit: int, cursor: Optional[str], response: Response
+) -> list:
+    """One page of `collection` in (sort_field, id) order, setting X-Next-Cursor if more remain"""
+    docs = await collection.find(
+        keyset_query(query, sort_field, direction, cursor), projection
+    ).sort(keyset_sort(sort_field, direction)).limit(limit + 1).to_list(limit + 1)
+    return set_next_cursor(response, docs, limit, sort_field)
+
+# ============== JSON SERIALIZATION ==============
+
+# List endpoints serialize documents this service wrote itself straight to JSON.
+# Validating each one into a model and then letting FastAPI validate and encode
+# the models again through response_model costs more CPU than the query. The
+# projection from model_projection limits documents to the model's fields, and
+# model_defaults fills the ones older documents lack.
+
+@functools.lru_cache(maxsize=None)
+def list_adapter(model) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+@functools.lru_cache(maxsize=None)
+def model_projection(model) -> dict:
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+@functools.lru_cache(maxsize=None)
+def model_defaults(model) -> dict:
+    return {
+        name: field.get_default(call_default_factory=True)
+        for name, field in model.model_fields.items() if not field.is_required()
+    }
+
+def trusted_json(model, docs: list) -> bytes:
+    """JSON list of `model` from stored documents, without validating them"""
+    defaults = model_defaults(model)
+    return orjson.dumps([{**defaults, **d} for d in docs])
+
+def json_list_response(body: bytes, response: Optional[Response] = None) -> Response:
+    """Pre-serialized JSON list, keeping the page's X-Next-Cursor header"""
+    headers = {}
+    if response is not None and NEXT_CURSOR_HEADER in response.headers:
+        headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ============== FIELD SELECTION ==============
+
+# List endpoints return a summary model by default. `fields=` picks other fields:
+# a comma-separated list of the full model's fields, where "summary" expands to
+# the summary fields, or "all" for full documents. `id` and the list's sort key
+# are always included because cursors are built from them.
+
+class FieldSelection:
+    """Mongo projection and serializer for one `fields=` value"""
+
+    def __init__(self, fields: Optional[str], summary_model, full_model, sort_field: str,
+                 summary_projection: Optional[dict] = None):
+        names = [name.strip() for name in (fields or "summary").split(",") if name.strip()] or ["summary"]
+        self.model = None
+        if names == ["summary"]:
+            self.model = summary_model
+            self.projection = {"_id": 0, **summary_projection} if summary_projection else model_projection(summary_model)
+        elif names == ["all"]:
+            self.model = full_model
+            self.projection = model_projection(full_model)
+        else:
+            selected = set()
+            for name in names:
+                if name == "summary":
+                    selected.update(summary_model.model_fields)
+                elif name in full_model.model_fields:
+                    selected.add(name)
+                else:
+                    raise HTTPException(status_code=400, detail={
+                        "message": f"Unknown field: {name}",
+                        "allowed": ["summary", "all", *full_model.model_fields],
+                    })
+            self.projection = {"_id": 0, "id": 1, sort_field: 1, **{name: 1 for name in sorted(selected)}}
+        self.key = tuple(sorted(names))
+
+    def serialize(self, docs: list) -> bytes:
+        if self.model is None:
+            return orjson.dumps(docs)
+        return trusted_json(self.model, docs)
+
+# ============== TRANSACTIONS ==============
+
+_transactions_supported: Optional[bool] = None
+
+async def transactions_supported() -> bool:
+    """Whether the deployment can run multi-document transactions (detected once)"""
+    global _transactions_supported
+    if MONGO_TRANSACTIONS != "auto":
+        return MONGO_TRANSACTIONS == "on"
+    if _transactions_supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions_supported = False
+    return _transactions_supported
+
 # ============== AUTH HELPERS ==============
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# Module-level so they can be pickled into a process pool; each returns
+# (result, started, finished) so the caller can split queue wait from hash time
+def _bcrypt_hash(password: str) -> tuple:
+    started = time.monotonic()
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hashed, started, time.monotonic()
+
+def _bcrypt_check(password: str, hashed: str) -> tuple:
+    started = time.monotonic()
+    matches = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return matches, started, time.monotonic()
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread or process pool with queue-depth backpressure"""
+
+    def __init__(self, executor_kind: str, workers: int, max_queue: int):
+        self.executor_kind = executor_kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._executor: Optional[Executor] = None
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "hash_seconds_total": 0.0,
+            "hash_seconds_max": 0.0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        # Work beyond the pool size waits in the executor queue; past that, shed load
+        if self.in_flight >= self.workers + self.max_queue:
+            self.stats["rejected"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication is busy, please retry shortly",
+                headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)}
+            )
+        self.in_flight += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+        queue_wait = max(0.0, started - submitted)
+        hash_time = finished - started
+        self.stats["completed"] += 1
+        self.stats["queue_wait_seconds_total"] += queue_wait
+        self.stats["queue_wait_seconds_max"] = max(self.stats["queue_wait_seconds_max"], queue_wait)
+        self.stats["hash_seconds_total"] += hash_time
+        self.stats["hash_seconds_max"] = max(self.stats["hash_seconds_max"], hash_time)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_bcrypt_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_bcrypt_check, password, hashed)
+
+    def snapshot(self) -> dict:
+        completed = self.stats["completed"] or 1
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            **self.stats,
+            "queue_wait_seconds_avg": self.stats["queue_wait_seconds_total"] / completed,
+            "hash_seconds_avg": self.stats["hash_seconds_total"] / completed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+password_hasher = PasswordHasher(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
 
 def create_access_token(user_id: str, role: str) -> str:
     expires = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -302,20 +921,27 @@ def create_access_token(user_id: str, role: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_access_token(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = decode_access_token(credentials.credentials)
+    user_id = payload["sub"]
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal_cache.set(user_id, user)
+    return dict(user)
 
 async def get_vendor_user(current_user: dict = Depends(get_current_user)):
     if current_user.get("role") not in ["vendor", "admin"]:
@@ -327,6 +953,29 @@ async def get_admin_user(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
+async def get_token_principal(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Principal for read-only routes that only need `id` and `role`.
+
+    With TRUST_TOKEN_ROLES on, the signed claims are used as-is and no user
+    lookup happens; otherwise this is the same as get_current_user.
+    """
+    if not TRUST_TOKEN_ROLES:
+        return await get_current_user(credentials)
+    payload = decode_access_token(credentials.credentials)
+    if not payload.get("role"):
+        return await get_current_user(credentials)
+    return {"id": payload["sub"], "role": payload["role"]}
+
+async def get_token_vendor(current_user: dict = Depends(get_token_principal)):
+    if current_user.get("role") not in ["vendor", "admin"]:
+        raise HTTPException(status_code=403, detail="Vendor access required")
+    return current_user
+
+async def get_token_admin(current_user: dict = Depends(get_token_principal)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
 # ============== AUTH ROUTES ==============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -340,7 +989,7 @@ async def register(user_data: UserCreate):
         "id": user_id,
         "email": user_data.email,
         "name": user_data.name,
-        "password": hash_password(user_data.password),
+        "password": await hash_password(user_data.password),
         "role": user_data.role,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
@@ -361,7 +1010,7 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user["password"]):
+    if not user or not await verify_password(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_access_token(user["id"], user["role"])
@@ -399,7 +1048,7 @@ async def register_vendor(vendor_data: VendorCreate):
         "id": user_id,
         "email": vendor_data.email,
         "name": vendor_data.name,
-        "password": hash_password(vendor_data.password),
+        "password": await hash_password(vendor_data.password),
         "role": "vendor",
         "business_name": vendor_data.business_name,
         "description": vendor_data.description,
@@ -459,6 +1108,7 @@ async def approve_vendor(vendor_id: str, current_user: dict = Depends(get_admin_
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Vendor not found")
+    invalidate_principal(vendor_id)
     return {"message": "Vendor approved"}
 
 # ============== PRODUCT ROUTES ==============
@@ -475,21 +1125,13 @@ async def create_product(product: ProductCreate, current_user: dict = Depends(ge
         "review_count": 0,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    product_doc["updated_at"] = product_doc["created_at"]
     await db.products.insert_one(product_doc)
+    invalidate_catalog(product_id)
     return ProductResponse(**{k: v for k, v in product_doc.items() if k != "_id"})
 
-@api_router.get("/products", response_model=List[ProductResponse])
-async def get_products(
-    category: Optional[str] = None,
-    min_price: Optional[float] = None,
-    max_price: Optional[float] = None,
-    min_size: Optional[float] = None,
-    max_size: Optional[float] = None,
-    brand: Optional[str] = None,
-    in_stock: Optional[bool] = None,
-    limit: int = 50,
-    skip: int = 0
-):
+def product_filter_query(category, min_price, max_price, min_size, max_size, brand, in_stock) -> dict:
+    """Mongo filter for the shop page's exact-match and range filters"""
     query = {}
     if category:
         query["category"] = category
@@ -505,24 +1147,170 @@ async def get_products(
         query["brand"] = brand
     if in_stock is not None:
         query["in_stock"] = in_stock
+    return query
+
+@api_router.get("/products", response_model=List[ProductSummary])
+async def get_products(
+    request: Request,
+    response: Response,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_size: Optional[float] = None,
+    max_size: Optional[float] = None,
+    brand: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    fields: Optional[str] = None
+):
+    """Catalog listing as product summaries, newest first (see FieldSelection for `fields`).
+    Page with `cursor` (X-Next-Cursor); `skip` is kept for older clients but costs a
+    scan of every skipped product."""
+    query = product_filter_query(category, min_price, max_price, min_size, max_size, brand, in_stock)
+    selection = FieldSelection(fields, ProductSummary, ProductResponse, "created_at")
+    
+    async def build():
+        if skip and not cursor:
+            products = await db.products.find(query, selection.projection).sort(
+                keyset_sort("created_at", -1)
+            ).skip(skip).limit(limit).to_list(limit)
+        else:
+            products = await fetch_page(db.products, query, selection.projection, "created_at", -1, limit, cursor, response)
+        headers = {}
+        if NEXT_CURSOR_HEADER in response.headers:
+            headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+        return selection.serialize(products), headers
     
-    products = await db.products.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    return [ProductResponse(**p) for p in products]
+    key = ("products", category, min_price, max_price, min_size, max_size, brand, in_stock, limit, cursor, skip, selection.key)
+    return await cached_catalog_response(request, key, build)
 
-@api_router.get("/products/featured", response_model=List[ProductResponse])
-async def get_featured_products(category: Optional[str] = None, limit: int = 8):
+@api_router.get("/products/featured", response_model=List[ProductSummary])
+async def get_featured_products(
+    request: Request,
+    category: Optional[str] = None,
+    limit: int = 8,
+    fields: Optional[str] = None
+):
     query = {"in_stock": True}
     if category:
         query["category"] = category
-    products = await db.products.find(query, {"_id": 0}).sort("rating", -1).limit(limit).to_list(limit)
-    return [ProductResponse(**p) for p in products]
+    selection = FieldSelection(fields, ProductSummary, ProductResponse, "rating")
+    
+    async def build():
+        products = await db.products.find(query, selection.projection).sort("rating", -1).limit(limit).to_list(limit)
+        return selection.serialize(products), {}
+    
+    return await cached_catalog_response(request, ("featured", category, limit, selection.key), build)
+
+# Lower bounds of the range facets; the last bucket is open-ended
+SEARCH_SIZE_BUCKETS_KW = [0, 3, 5, 10, 25, 100]
+SEARCH_PRICE_BUCKETS = [0, 100000, 250000, 500000, 1000000, 2500000]
+SEARCH_QUERY_MAX_LENGTH = 200
+SEARCH_MAX_SKIP = 500
+
+def _range_facet_stage(field: str, bounds: list) -> list:
+    return [{"$bucket": {
+        "groupBy": f"${field}",
+        "boundaries": bounds + [float("inf")],
+        "default": "other",  # missing or non-numeric values
+        "output": {"count": {"$sum": 1}},
+    }}]
+
+def product_search_pipeline(q: Optional[str], filters: dict, skip: int, limit: int) -> list:
+    """One aggregation returning a page of hits, the total, and facet counts.
+
+    With `q`, hits are ranked by text score over the weighted text index;
+    without it they are newest first. Facets count the whole filtered match set.
+    """
+    if q:
+        match = {"$text": {"$search": q}, **filters}
+        order = {"score": -1, "created_at": -1, "id": -1}
+        score = [{"$addFields": {"score": {"$meta": "textScore"}}}]
+    else:
+        match = filters
+        order = {"created_at": -1, "id": -1}
+        score = []
+    count_by = lambda field: [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}]
+    return [
+        {"$match": match},
+        *score,
+        {"$facet": {
+            "results": [{"$sort": order}, {"$skip": skip}, {"$limit": limit}, {"$project": {"_id": 0}}],
+            "total": [{"$count": "count"}],
+            "brand": count_by("brand"),
+            "category": count_by("category"),
+            "system_size_kw": _range_facet_stage("system_size_kw", SEARCH_SIZE_BUCKETS_KW),
+            "price": _range_facet_stage("price", SEARCH_PRICE_BUCKETS),
+        }},
+    ]
+
+def _range_facet_counts(buckets: list, bounds: list) -> List[RangeFacetCount]:
+    counts = []
+    for bucket in buckets:
+        if bucket["_id"] == "other":
+            continue
+        position = bounds.index(bucket["_id"])
+        upper = bounds[position + 1] if position + 1 < len(bounds) else None
+        counts.append(RangeFacetCount(min=bucket["_id"], max=upper, count=bucket["count"]))
+    return counts
+
+def _value_facet_counts(buckets: list) -> List[FacetCount]:
+    return [FacetCount(value=str(b["_id"]), count=b["count"]) for b in buckets if b["_id"] is not None]
+
+async def search_products(q: Optional[str], filters: dict, skip: int = 0, limit: int = 20) -> ProductSearchResponse:
+    docs = await db.products.aggregate(product_search_pipeline(q, filters, skip, limit)).to_list(1)
+    facets = docs[0] if docs else {}
+    return ProductSearchResponse(
+        results=[ProductSearchHit(**p) for p in facets.get("results", [])],
+        total=facets["total"][0]["count"] if facets.get("total") else 0,
+        facets=ProductSearchFacets(
+            brand=_value_facet_counts(facets.get("brand", [])),
+            category=_value_facet_counts(facets.get("category", [])),
+            system_size_kw=_range_facet_counts(facets.get("system_size_kw", []), SEARCH_SIZE_BUCKETS_KW),
+            price=_range_facet_counts(facets.get("price", []), SEARCH_PRICE_BUCKETS),
+        ),
+    )
+
+@api_router.get("/products/search", response_model=ProductSearchResponse)
+async def search_products_route(
+    request: Request,
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_size: Optional[float] = None,
+    max_size: Optional[float] = None,
+    brand: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=100),
+    skip: int = Query(0, ge=0, le=SEARCH_MAX_SKIP)
+):
+    """Relevance-ranked product search with brand, category, size and price facet counts"""
+    q = " ".join((q or "").split())[:SEARCH_QUERY_MAX_LENGTH] or None
+    filters = product_filter_query(category, min_price, max_price, min_size, max_size, brand, in_stock)
+    
+    async def build():
+        result = await search_products(q, filters, skip, limit)
+        return result.model_dump_json().encode(), {}
+    
+    key = ("search", q.lower() if q else None, category, min_price, max_price, min_size, max_size, brand, in_stock, limit, skip)
+    return await cached_catalog_response(request, key, build)
 
 @api_router.get("/products/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return ProductResponse(**product)
+async def get_product(product_id: str, request: Request):
+    async def build():
+        product = await db.products.find_one({"id": product_id}, {"_id": 0})
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        headers = {}
+        last_modified = http_date(product.get("updated_at") or product.get("created_at"))
+        if last_modified:
+            headers["Last-Modified"] = last_modified
+        return ProductResponse(**product).model_dump_json().encode(), headers
+    
+    return await cached_catalog_response(request, ("product", product_id), build)
 
 @api_router.put("/products/{product_id}", response_model=ProductResponse)
 async def update_product(product_id: str, updates: ProductUpdate, current_user: dict = Depends(get_vendor_user)):
@@ -534,7 +1322,9 @@ async def update_product(product_id: str, updates: ProductUpdate, current_user:
     
     update_data = {k: v for k, v in updates.model_dump().items() if v is not None}
     if update_data:
+        update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
         await db.products.update_one({"id": product_id}, {"$set": update_data})
+        invalidate_catalog(product_id)
     
     updated = await db.products.find_one({"id": product_id}, {"_id": 0})
     return ProductResponse(**updated)
@@ -548,17 +1338,28 @@ async def delete_product(product_id: str, current_user: dict = Depends(get_vendo
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.products.delete_one({"id": product_id})
+    invalidate_catalog(product_id)
     return {"message": "Product deleted"}
 
 @api_router.get("/vendor/products", response_model=List[ProductResponse])
-async def get_vendor_products(current_user: dict = Depends(get_vendor_user)):
-    products = await db.products.find({"vendor_id": current_user["id"]}, {"_id": 0}).to_list(100)
-    return [ProductResponse(**p) for p in products]
+async def get_vendor_products(current_user: dict = Depends(get_token_vendor)):
+    products = await db.products.find({"vendor_id": current_user["id"]}, model_projection(ProductResponse)).to_list(100)
+    return json_list_response(trusted_json(ProductResponse, products))
 
 # ============== SOLAR CALCULATOR ==============
 
 # OpenWeatherMap API key
-OPENWEATHERMAP_API_KEY = "2096dd7fb74f7d1b1a5096a61abad00f"
+OPENWEATHERMAP_API_KEY = os.environ.get('OPENWEATHERMAP_API_KEY', "2096dd7fb74f7d1b1a5096a61abad00f")
+OPENWEATHERMAP_URL = os.environ.get('OPENWEATHERMAP_URL', "https://api.openweathermap.org/data/2.5/weather")
+
+# Weather lookups: openweathermap, or static for tests and offline development
+WEATHER_PROVIDER = os.environ.get('WEATHER_PROVIDER', 'openweathermap')
+WEATHER_CACHE_TTL = float(os.environ.get('WEATHER_CACHE_TTL', '1800'))  # cloud cover changes slowly
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', '1000'))
+WEATHER_TIMEOUT = float(os.environ.get('WEATHER_TIMEOUT', '2.0'))
+# Failed or unknown-city lookups cache the fallback this long so they are not retried on every request
+WEATHER_NEGATIVE_TTL = float(os.environ.get('WEATHER_NEGATIVE_TTL', '60'))
+DEFAULT_WEATHER_FACTOR = 0.85
 
 # India city data: Average peak sun hours and electricity tariffs (₹/kWh)
 INDIA_SOLAR_DATA = {
@@ -593,29 +1394,98 @@ PANEL_EFFICIENCY = 0.20  # 20% efficiency
 # System losses factor
 SYSTEM_LOSSES = 0.80  # 20% losses (inverter, DC cables, dust, temp)
 
-async def get_weather_factor(city: str) -> float:
-    """Get cloud-based solar factor from OpenWeatherMap (1.0 = clear, 0.5 = very cloudy)"""
+# Shared pooled client for outbound HTTP, opened at startup and closed at shutdown
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(WEATHER_TIMEOUT),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return http_client
+
+class OpenWeatherMapProvider:
+    """Current cloud cover (0-100%) from OpenWeatherMap"""
+
+    def __init__(self, url: str, api_key: str):
+        self.url = url
+        self.api_key = api_key
+
+    async def cloud_cover(self, city: str) -> Optional[float]:
+        response = await get_http_client().get(
+            self.url,
+            params={"q": f"{city},IN", "appid": self.api_key, "units": "metric"}
+        )
+        if response.status_code != 200:
+            return None
+        return response.json().get("clouds", {}).get("all", 0)
+
+class StaticWeatherProvider:
+    """Fixed cloud cover per city, so tests never leave the process"""
+
+    def __init__(self, cloud_cover: Optional[dict] = None, default: float = 30):
+        self.cloud_cover_by_city = cloud_cover or {}
+        self.default = default
+
+    async def cloud_cover(self, city: str) -> Optional[float]:
+        return self.cloud_cover_by_city.get(city, self.default)
+
+weather_provider = (
+    StaticWeatherProvider() if WEATHER_PROVIDER == "static"
+    else OpenWeatherMapProvider(OPENWEATHERMAP_URL, OPENWEATHERMAP_API_KEY)
+)
+weather_cache = TTLCache(WEATHER_CACHE_SIZE, WEATHER_CACHE_TTL)
+# One upstream call per city at a time; concurrent callers await the same task
+_weather_inflight: dict = {}
+
+def set_weather_provider(provider):
+    """Swap the weather source (e.g. a stub in tests) and drop cached factors"""
+    global weather_provider
+    weather_provider = provider
+    weather_cache.clear()
+
+async def _fetch_weather_factor(city_key: str) -> float:
     try:
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://api.openweathermap.org/data/2.5/weather",
-                params={"q": f"{city},IN", "appid": OPENWEATHERMAP_API_KEY, "units": "metric"}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                clouds = data.get("clouds", {}).get("all", 0)  # 0-100%
-                # Convert cloud % to solar factor (100% clouds = 0.5 factor)
-                solar_factor = 1 - (clouds / 200)
-                return max(0.5, min(1.0, solar_factor))
-    except Exception:
-        pass
-    return 0.85  # Default factor
+        clouds = await asyncio.wait_for(weather_provider.cloud_cover(city_key), WEATHER_TIMEOUT)
+    except Exception as e:
+        logging.warning(f"Weather lookup failed for {city_key}: {e!r}")
+        clouds = None
+    if clouds is None:
+        weather_cache.set(city_key, DEFAULT_WEATHER_FACTOR, ttl=WEATHER_NEGATIVE_TTL)
+        return DEFAULT_WEATHER_FACTOR
+    # Convert cloud % to solar factor (100% clouds = 0.5 factor)
+    solar_factor = max(0.5, min(1.0, 1 - (clouds / 200)))
+    weather_cache.set(city_key, solar_factor)
+    return solar_factor
 
-@api_router.post("/calculator/calculate", response_model=SolarCalculatorResult)
-async def calculate_solar(input_data: SolarCalculatorInput):
+async def get_weather_factor(city: str) -> float:
+    """Get cloud-based solar factor (1.0 = clear, 0.5 = very cloudy), 0.85 if unavailable"""
+    city_key = city.lower().strip()
+    cached = weather_cache.get(city_key)
+    if cached is not None:
+        return cached
+    task = _weather_inflight.get(city_key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_weather_factor(city_key))
+        _weather_inflight[city_key] = task
+        task.add_done_callback(lambda _: _weather_inflight.pop(city_key, None))
+    # Shield so one cancelled caller does not cancel the lookup for the others
+    return await asyncio.shield(task)
+
+# INDIA_SOLAR_DATA as arrays so a whole batch of cities is looked up at once
+_CITY_ROWS = {city: i for i, city in enumerate(INDIA_SOLAR_DATA)}
+_CITY_SUN_HOURS = np.array([data[0] for data in INDIA_SOLAR_DATA.values()])
+_CITY_TARIFFS = np.array([data[1] for data in INDIA_SOLAR_DATA.values()])
+
+# Upper bound on rows per /calculator/batch request
+CALCULATOR_BATCH_MAX_ROWS = int(os.environ.get('CALCULATOR_BATCH_MAX_ROWS', '10000'))
+
+def solar_estimates(monthly_bill, property_type, city_key, backup_required, weather_factor) -> dict:
     """
-    Scientific Solar Calculator based on Tata Power methodology
+    Vectorized solar calculator: each argument is a sequence with one entry per row
+    and each returned value is an array aligned with the input rows.
     
     Formula Flow:
     1. Monthly Bill → Daily Consumption (kWh) = Bill / Tariff / 30
@@ -628,20 +1498,19 @@ async def calculate_solar(input_data: SolarCalculatorInput):
     8. Payback Years = Cost / Annual Savings
     9. CO2 Reduction = Annual Production × 0.82 kg/kWh (India grid factor)
     """
+    monthly_bill = np.asarray(monthly_bill, dtype=float)
+    is_home = np.asarray(property_type) == "home"
+    backup_required = np.asarray(backup_required, dtype=bool)
+    weather_factor = np.asarray(weather_factor, dtype=float)
     
     # Get city-specific data or defaults
-    city_key = input_data.city.lower().strip()
-    peak_sun_hours, electricity_tariff = INDIA_SOLAR_DATA.get(
-        city_key, 
-        INDIA_SOLAR_DATA["default"]
-    )
-    
-    # Get real-time weather adjustment factor
-    weather_factor = await get_weather_factor(input_data.city)
+    rows = np.array([_CITY_ROWS.get(city, _CITY_ROWS["default"]) for city in city_key], dtype=int)
+    peak_sun_hours = _CITY_SUN_HOURS[rows]
+    electricity_tariff = _CITY_TARIFFS[rows]
     
     # Step 1: Calculate daily energy consumption (kWh/day)
     # Monthly Bill / Tariff = Monthly kWh, / 30 = Daily kWh
-    daily_consumption_kwh = input_data.monthly_bill / electricity_tariff / 30
+    daily_consumption_kwh = monthly_bill / electricity_tariff / 30
     
     # Step 2: Calculate required system size (kW)
     # System must produce daily_consumption in peak_sun_hours
@@ -650,29 +1519,25 @@ async def calculate_solar(input_data: SolarCalculatorInput):
     required_system_kw = daily_consumption_kwh / effective_sun_hours
     
     # Step 3: Add buffer for battery backup
-    if input_data.backup_required:
-        required_system_kw *= 1.25  # 25% extra for battery and backup
+    required_system_kw = np.where(backup_required, required_system_kw * 1.25, required_system_kw)  # 25% extra for battery and backup
     
     # Round to nearest 0.5 kW
-    recommended_size_kw = round(required_system_kw * 2) / 2
-    recommended_size_kw = max(1.0, recommended_size_kw)  # Minimum 1kW
+    recommended_size_kw = np.round(required_system_kw * 2) / 2
+    recommended_size_kw = np.maximum(1.0, recommended_size_kw)  # Minimum 1kW
     
     # Step 4: Calculate number of panels
-    num_panels = int(round(recommended_size_kw * 1000 / PANEL_WATTAGE))
+    num_panels = np.round(recommended_size_kw * 1000 / PANEL_WATTAGE).astype(int)
     
     # Step 5: Calculate installation cost
-    cost_per_watt = COST_PER_WATT_HOME if input_data.property_type == "home" else COST_PER_WATT_COMMERCIAL
+    cost_per_watt = np.where(is_home, COST_PER_WATT_HOME, COST_PER_WATT_COMMERCIAL)
     estimated_cost = recommended_size_kw * 1000 * cost_per_watt
     
-    # Apply government subsidy (PM Surya Ghar) for residential
-    subsidy = 0
-    if input_data.property_type == "home":
-        if recommended_size_kw <= 2:
-            subsidy = 30000  # ₹30,000 for up to 2kW
-        elif recommended_size_kw <= 3:
-            subsidy = 60000  # ₹60,000 for up to 3kW
-        else:
-            subsidy = 78000  # ₹78,000 for above 3kW (up to 10kW)
+    # Apply government subsidy (PM Surya Ghar) for residential:
+    # ₹30,000 up to 2kW, ₹60,000 up to 3kW, ₹78,000 above 3kW (up to 10kW)
+    residential_subsidy = np.select(
+        [recommended_size_kw <= 2, recommended_size_kw <= 3], [30000, 60000], default=78000
+    )
+    subsidy = np.where(is_home, residential_subsidy, 0)
     
     net_cost = estimated_cost - subsidy
     
@@ -682,18 +1547,135 @@ async def calculate_solar(input_data: SolarCalculatorInput):
     annual_savings = annual_generation_kwh * electricity_tariff * 0.95  # 95% utilization
     
     # Step 7: Payback period
-    payback_years = net_cost / annual_savings if annual_savings > 0 else 10
+    has_savings = annual_savings > 0
+    payback_years = np.where(has_savings, net_cost / np.where(has_savings, annual_savings, 1), 10)
     
     # Step 8: CO2 reduction (India grid emission factor: 0.82 kg CO2/kWh)
     co2_reduction_kg = annual_generation_kwh * 0.82
     
-    return SolarCalculatorResult(
-        recommended_size_kw=recommended_size_kw,
-        estimated_cost=round(net_cost, 2),
-        annual_savings=round(annual_savings, 2),
-        payback_years=round(payback_years, 1),
-        co2_reduction_kg=round(co2_reduction_kg, 1)
+    return {
+        "recommended_size_kw": recommended_size_kw,
+        "num_panels": num_panels,
+        "subsidy": subsidy,
+        "net_cost": net_cost,
+        "annual_savings": annual_savings,
+        "payback_years": payback_years,
+        "co2_reduction_kg": co2_reduction_kg,
+    }
+
+def solar_result_row(estimates: dict, i: int) -> dict:
+    """Row `i` of solar_estimates() rounded the way SolarCalculatorResult reports it"""
+    return {
+        "recommended_size_kw": float(estimates["recommended_size_kw"][i]),
+        "estimated_cost": round(float(estimates["net_cost"][i]), 2),
+        "annual_savings": round(float(estimates["annual_savings"][i]), 2),
+        "payback_years": round(float(estimates["payback_years"][i]), 1),
+        "co2_reduction_kg": round(float(estimates["co2_reduction_kg"][i]), 1),
+    }
+
+@api_router.post("/calculator/calculate", response_model=SolarCalculatorResult)
+async def calculate_solar(input_data: SolarCalculatorInput):
+    """
+    Scientific Solar Calculator based on Tata Power methodology (see solar_estimates)
+    """
+    # Get real-time weather adjustment factor
+    weather_factor = await get_weather_factor(input_data.city)
+    
+    estimates = solar_estimates(
+        [input_data.monthly_bill],
+        [input_data.property_type],
+        [input_data.city.lower().strip()],
+        [input_data.backup_required],
+        [weather_factor]
     )
+    return SolarCalculatorResult(**solar_result_row(estimates, 0))
+
+def _parse_batch_rows(raw_rows: list) -> List[SolarCalculatorInput]:
+    rows, errors = [], []
+    for i, raw in enumerate(raw_rows):
+        try:
+            rows.append(SolarCalculatorInput.model_validate(raw))
+        except Exception as e:
+            errors.append({"row": i, "error": str(e)})
+    if errors:
+        raise HTTPException(status_code=422, detail=errors[:100])
+    return rows
+
+@api_router.post("/calculator/batch")
+async def calculate_solar_batch(request: Request, format: Optional[str] = None):
+    """
+    Size many properties in one request.
+
+    Accepts a JSON array of calculator inputs, a CSV body (text/csv) or a CSV file
+    upload (multipart field `file`) with columns monthly_bill, property_type, city,
+    backup_required. Each distinct city's weather factor is fetched once and all rows
+    are computed in one vectorized pass. Results stream back in input order as NDJSON
+    (default for JSON input) or CSV (default for CSV input), selectable with `format`.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        try:
+            raw_rows = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Body is not valid JSON: {e}")
+        if not isinstance(raw_rows, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of calculator inputs")
+        output_format = format or "ndjson"
+    else:
+        if content_type.startswith("multipart/form-data"):
+            upload = (await request.form()).get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Upload the CSV as form field 'file'")
+            data = await upload.read()
+        else:
+            data = await request.body()
+        try:
+            raw_rows = list(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))))
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
+        except csv.Error as e:
+            raise HTTPException(status_code=400, detail=f"Malformed CSV: {e}")
+        output_format = format or "csv"
+    
+    if output_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    if len(raw_rows) > CALCULATOR_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {CALCULATOR_BATCH_MAX_ROWS} rows per batch")
+    rows = _parse_batch_rows(raw_rows)
+    
+    city_keys = [row.city.lower().strip() for row in rows]
+    distinct_cities = list(set(city_keys))
+    factors = await asyncio.gather(*(get_weather_factor(city) for city in distinct_cities))
+    factor_by_city = dict(zip(distinct_cities, factors))
+    
+    estimates = solar_estimates(
+        [row.monthly_bill for row in rows],
+        [row.property_type for row in rows],
+        city_keys,
+        [row.backup_required for row in rows],
+        [factor_by_city[city] for city in city_keys]
+    )
+    
+    def stream_results():
+        columns = ["row", *SolarCalculatorInput.model_fields, *SolarCalculatorResult.model_fields]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns)
+        if output_format == "csv":
+            writer.writeheader()
+        for i, row in enumerate(rows):
+            result = {"row": i, **row.model_dump(), **solar_result_row(estimates, i)}
+            if output_format == "csv":
+                writer.writerow(result)
+            else:
+                buffer.write(json.dumps(result) + "\n")
+            if i % 500 == 499:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(stream_results(), media_type=media_type)
 
 # Alias for frontend compatibility
 @api_router.post("/calculator", response_model=SolarCalculatorResult)
@@ -707,20 +1689,31 @@ async def calculate_solar_alias(input_data: SolarCalculatorInput):
 async def create_order(order_data: OrderCreate, current_user: dict = Depends(get_current_user)):
     order_id = str(uuid.uuid4())
     
+    # Resolve every product in one round trip
+    product_ids = list(dict.fromkeys(item.product_id for item in order_data.items))
+    products = await db.products.find(
+        {"id": {"$in": product_ids}},
+        {"_id": 0, "id": 1, "name": 1, "price": 1, "vendor_id": 1}
+    ).to_list(len(product_ids))
+    products_by_id = {p["id"]: p for p in products}
+    
+    missing = [pid for pid in product_ids if pid not in products_by_id]
+    if missing:
+        raise HTTPException(status_code=400, detail={"message": "Products not found", "product_ids": missing})
+    
     # Calculate total and get product details
     items = []
     total = 0
     for item in order_data.items:
-        product = await db.products.find_one({"id": item.product_id}, {"_id": 0})
-        if product:
-            items.append({
-                "product_id": item.product_id,
-                "name": product["name"],
-                "price": product["price"],
-                "quantity": item.quantity,
-                "vendor_id": product["vendor_id"]
-            })
-            total += product["price"] * item.quantity
+        product = products_by_id[item.product_id]
+        items.append({
+            "product_id": item.product_id,
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": item.quantity,
+            "vendor_id": product["vendor_id"]
+        })
+        total += product["price"] * item.quantity
     
     order = {
         "id": order_id,
@@ -733,25 +1726,36 @@ async def create_order(order_data: OrderCreate, current_user: dict = Depends(get
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.orders.insert_one(order)
+    await apply_rollup_ops(rollup_ops_for_new_order(order))
     
     return OrderResponse(**{k: v for k, v in order.items() if k != "_id"})
 
 @api_router.get("/orders", response_model=List[OrderResponse])
-async def get_orders(current_user: dict = Depends(get_current_user)):
+async def get_orders(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_principal)
+):
     query = {"user_id": current_user["id"]}
     if current_user["role"] == "admin":
         query = {}
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return [OrderResponse(**o) for o in orders]
+    orders = await fetch_page(db.orders, query, model_projection(OrderResponse), "created_at", -1, limit, cursor, response)
+    return json_list_response(trusted_json(OrderResponse, orders), response)
 
 @api_router.get("/vendor/orders", response_model=List[OrderResponse])
-async def get_vendor_orders(current_user: dict = Depends(get_vendor_user)):
+async def get_vendor_orders(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_vendor)
+):
     # Get orders that contain products from this vendor
-    orders = await db.orders.find(
-        {"items.vendor_id": current_user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return [OrderResponse(**o) for o in orders]
+    orders = await fetch_page(
+        db.orders, {"items.vendor_id": current_user["id"]}, model_projection(OrderResponse),
+        "created_at", -1, limit, cursor, response
+    )
+    return json_list_response(trusted_json(OrderResponse, orders), response)
 
 @api_router.put("/orders/{order_id}/status")
 async def update_order_status(order_id: str, status_data: dict, current_user: dict = Depends(get_current_user)):
@@ -767,11 +1771,197 @@ async def update_order_status(order_id: str, status_data: dict, current_user: di
         if not order:
             raise HTTPException(status_code=403, detail="You can only update orders assigned to you")
     
-    result = await db.orders.update_one({"id": order_id}, {"$set": {"status": status}})
-    if result.modified_count == 0:
+    previous = await db.orders.find_one_and_update(
+        {"id": order_id}, {"$set": {"status": status}}, ROLLUP_ORDER_FIELDS
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    await apply_rollup_ops(rollup_ops_for_status_change(previous, status))
     return {"message": f"Order status updated to {status}"}
 
+# ============== WRITE-BEHIND ==============
+
+class WriteBehindBuffer:
+    """Collects documents bound for one collection and writes them in batches.
+
+    A background task flushes with insert_many once `batch_size` documents are
+    pending or `flush_interval` seconds have passed. stop() tells the task to
+    finish its current batch and drain what is left, rather than cancelling it
+    mid-write.
+    Records are dropped (and counted) when `max_pending` is reached or a batch
+    fails, so a slow or unavailable database never backs up the request path.
+    """
+
+    def __init__(self, collection_name: str, batch_size: int, flush_interval: float, max_pending: int):
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: list = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    def add(self, doc: dict) -> bool:
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._pending.append(doc)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def start(self):
+        if self._task is None:
+            # Fresh primitives so they belong to the running event loop
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                await self._write(batch)
+
+    async def _write(self, batch: list):
+        self.batches += 1
+        try:
+            await db[self.collection_name].insert_many(batch, ordered=False)
+            self.flushed += len(batch)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+            self.flushed += inserted
+            self.dropped += len(batch) - inserted
+            self.failed_batches += 1
+            logger.error(f"{self.collection_name} write-behind: {len(batch) - inserted} of {len(batch)} records dropped")
+        except Exception as e:
+            self.dropped += len(batch)
+            self.failed_batches += 1
+            logger.error(f"{self.collection_name} write-behind: batch of {len(batch)} dropped: {e}")
+
+    def snapshot(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+        }
+
+class CounterBuffer:
+    """Per-document increments of one numeric field, accumulated in memory.
+
+    Every `flush_interval` seconds the counts are swapped out and written with a
+    single unordered bulk_write of $inc updates. stop() lets a flush in progress
+    finish and then drains what is left.
+    Counts from a failed write are merged back and retried on the next flush.
+    """
+
+    def __init__(self, collection_name: str, field: str, flush_interval: float):
+        self.collection_name = collection_name
+        self.field = field
+        self.flush_interval = flush_interval
+        self._counts: dict = {}
+        self._flush_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def increment(self, doc_id: str, amount: int = 1):
+        self._counts[doc_id] = self._counts.get(doc_id, 0) + amount
+
+    def pending(self, doc_id: str) -> int:
+        return self._counts.get(doc_id, 0)
+
+    def start(self):
+        if self._task is None:
+            # Fresh primitives so they belong to the running event loop
+            self._flush_lock = asyncio.Lock()
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._counts:
+                return
+            counts, self._counts = self._counts, {}
+            self.flushes += 1
+            try:
+                await db[self.collection_name].bulk_write(
+                    [UpdateOne({"id": doc_id}, {"$inc": {self.field: n}}) for doc_id, n in counts.items()],
+                    ordered=False
+                )
+                self.flushed += sum(counts.values())
+            except Exception as e:
+                self.failed_flushes += 1
+                for doc_id, n in counts.items():
+                    self.increment(doc_id, n)
+                logger.error(f"{self.collection_name}.{self.field} counter flush failed, will retry: {e}")
+
+    def snapshot(self) -> dict:
+        return {
+            "pending_documents": len(self._counts),
+            "pending": sum(self._counts.values()),
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+chat_history_buffer = WriteBehindBuffer(
+    "chat_history", CHAT_HISTORY_BATCH_SIZE, CHAT_HISTORY_FLUSH_INTERVAL, CHAT_HISTORY_MAX_PENDING
+)
+
+blog_view_counter = CounterBuffer("blogs", "views", BLOG_VIEW_FLUSH_INTERVAL)
+
+async def record_chat_turn(record: dict):
+    """Persist one chat exchange according to CHAT_HISTORY_WRITE_MODE"""
+    if CHAT_HISTORY_WRITE_MODE == "sync":
+        await db.chat_history.insert_one(record)
+    else:
+        chat_history_buffer.add(record)
+
 # ============== AI CHAT ASSISTANT ==============
 
 SOLAR_SYSTEM_PROMPT = """You are the SolarSavers AI Assistant, an expert in solar energy solutions for homes and commercial properties. 
@@ -789,77 +1979,392 @@ Be helpful, friendly, and concise. When users share their electricity bill, help
 
 For recommendations, you can suggest they use our Solar Calculator or browse our products. Keep responses under 150 words unless detailed explanation is needed."""
 
+# Fallback answers for common questions. Intents are checked in order: the first
+# intent with any keyword in the message wins, whatever its position in the text.
+# CHAT_FAQ_PATH may point at a JSON file of the same shape to replace this table.
+DEFAULT_CHAT_FAQ = {
+    "intents": [
+        {"intent": "price", "keywords": ["price", "cost"],
+         "answer": "Our solar systems range from ₹5,999 for a 3kW home system to ₹2,75,000 for industrial 250kW installations. Use our Solar Calculator for a personalized estimate!"},
+        {"intent": "size", "keywords": ["size", "kw"],
+         "answer": "The right system size depends on your electricity bill. A typical home uses 3-10kW, while commercial properties need 25-250kW. Try our Solar Calculator!"},
+        {"intent": "warranty", "keywords": ["warranty"],
+         "answer": "All our solar systems come with 25-30 year warranties. Premium brands like SunPower and LG offer extended performance guarantees."},
+        {"intent": "install", "keywords": ["install"],
+         "answer": "Installation typically takes 1-3 days for homes and 1-2 weeks for commercial projects. Our vendors handle permits and grid connection."},
+        {"intent": "save", "keywords": ["save", "bill"],
+         "answer": "On average, solar can reduce your electricity bills by 70-90%. Your exact savings depend on your consumption and system size."},
+    ],
+    "default": "Thanks for your question! I'm your SolarSavers assistant. For personalized recommendations, try our Solar Calculator or browse our products. How can I help you with solar energy today?"
+}
+
+class KeywordIntentMatcher:
+    """FAQ table compiled into one case-insensitive regex with a named group per intent.
+
+    A single scan of the message finds every keyword occurrence; the matched
+    intent earliest in the table wins. Keywords match as substrings, so "kw"
+    also answers "5kW" and "install" answers "installation".
+    """
+
+    def __init__(self, faq: dict):
+        self.intents = faq["intents"]
+        self.default = faq["default"]
+        alternatives = [
+            f"(?P<i{position}>" + "|".join(re.escape(k) for k in entry["keywords"]) + ")"
+            for position, entry in enumerate(self.intents)
+        ]
+        # Zero-width lookahead so overlapping keywords ("install" / "all") are all seen;
+        # at one position the alternation tries intents in table order
+        self.pattern = re.compile("(?=" + "|".join(alternatives) + ")", re.IGNORECASE)
+        self.matches = {entry["intent"]: 0 for entry in self.intents}
+        self.unmatched = 0
+
+    def match(self, message: str) -> Optional[dict]:
+        positions = {int(m.lastgroup[1:]) for m in self.pattern.finditer(message)}
+        if not positions:
+            self.unmatched += 1
+            return None
+        entry = self.intents[min(positions)]
+        self.matches[entry["intent"]] += 1
+        return entry
+
+    def answer(self, message: str) -> str:
+        entry = self.match(message)
+        return entry["answer"] if entry else self.default
+
+    def snapshot(self) -> dict:
+        return {"matches": dict(self.matches), "unmatched": self.unmatched}
+
+def load_chat_faq(path: Optional[str]) -> dict:
+    if not path:
+        return DEFAULT_CHAT_FAQ
+    try:
+        with open(path, encoding="utf-8") as f:
+            faq = json.load(f)
+        if not isinstance(faq.get("default"), str):
+            raise ValueError("missing default answer")
+        for entry in faq["intents"]:
+            if not (entry.get("intent") and entry.get("keywords") and entry.get("answer")):
+                raise ValueError(f"incomplete intent {entry!r}")
+        return faq
+    except Exception as e:
+        logging.error(f"Could not load chat FAQ from {path}, using built-in answers: {e!r}")
+        return DEFAULT_CHAT_FAQ
+
+intent_matcher = KeywordIntentMatcher(load_chat_faq(CHAT_FAQ_PATH))
+
+def set_intent_matcher(matcher):
+    """Swap the keyword matcher (e.g. after editing the FAQ table) and drop cached answers"""
+    global intent_matcher
+    intent_matcher = matcher
+    chat_answer_cache.clear()
+
+def keyword_response(message: str) -> str:
+    """Keyword-based answer used without an LLM or when the LLM call fails"""
+    return intent_matcher.answer(message)
+
+chat_answer_cache = TTLCache(CHAT_ANSWER_CACHE_SIZE, CHAT_ANSWER_CACHE_TTL)
+
+def normalize_question(message: str) -> str:
+    """Case, punctuation and spacing folded away: "How much, for 5kW?" == "how much for 5kw" """
+    return " ".join(re.sub(r"[^\w\s]", " ", message.lower()).split())
+
+class LlmChatProvider:
+    """Replies from emergentintegrations' LlmChat.
+
+    LlmChat keeps the history of every message sent through it, so a pooled chat
+    object per session gets the context from load_chat_context once, with its
+    first message, and only the new message after that. After `max_turns`
+    exchanges it is replaced by a fresh one seeded with the current context,
+    which keeps its history as bounded as the context window; 0 keeps one chat
+    object for as long as the session stays in the pool.
+    """
+
+    def __init__(self, api_key: str, pool_size: int, ttl: float, max_turns: int = 0):
+        self.api_key = api_key
+        self.max_turns = max_turns
+        # {"chat", "lock", "turns"} per session_id; the lock keeps one exchange per session in flight
+        self.sessions = TTLCache(pool_size, ttl)
+        self.created = 0
+
+    def _chat(self, session_id: str):
+        chat = LlmChat(api_key=self.api_key, session_id=session_id, system_message=SOLAR_SYSTEM_PROMPT)
+        chat.with_model("openai", "gpt-4")
+        return chat
+
+    def _session(self, session_id: str) -> dict:
+        session = self.sessions.get(session_id)
+        if session is None or (self.max_turns and session["turns"] >= self.max_turns):
+            self.created += 1
+            session = {"chat": self._chat(f"{session_id}:{uuid.uuid4().hex}"), "lock": asyncio.Lock(), "turns": 0}
+            self.sessions.set(session_id, session)
+        return session
+
+    async def reply(self, session_id: str, message: str, context: str = "") -> str:
+        session = self._session(session_id)
+        async with session["lock"]:
+            text = message
+            if session["turns"] == 0 and context:
+                text = f"{context}\n\nUser's new message: {message}"
+            answer = await session["chat"].send_message(UserMessage(text=text))
+            session["turns"] += 1
+            return answer
+
+    async def stream(self, session_id: str, message: str, context: str = ""):
+        # LlmChat only exposes whole completions, so the reply arrives as one chunk;
+        # LiteLlmChatProvider streams tokens
+        yield await self.reply(session_id, message, context)
+
+    def snapshot(self) -> dict:
+        return {**self.sessions.snapshot(), "created": self.created}
+
+class LiteLlmChatProvider:
+    """Replies streamed token by token from litellm's completion API.
+
+    Stateless: every call sends the system prompt, the context from
+    load_chat_context and the new message, so nothing is pooled per session.
+    """
+
+    def __init__(self, model: str, api_key: str, api_base: Optional[str] = None):
+        self.model = model
+        self.api_key = api_key
+        self.api_base = api_base
+        self.streams = 0
+        self.first_token_seconds_total = 0.0
+
+    def _messages(self, message: str, context: str) -> list:
+        messages = [{"role": "system", "content": SOLAR_SYSTEM_PROMPT}]
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    async def stream(self, session_id: str, message: str, context: str = ""):
+        started = time.monotonic()
+        response = await litellm.acompletion(
+            model=self.model, messages=self._messages(message, context), stream=True,
+            api_key=self.api_key, api_base=self.api_base, user=session_id
+        )
+        first = True
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if first:
+                first = False
+                self.streams += 1
+                self.first_token_seconds_total += time.monotonic() - started
+            yield delta
+
+    async def reply(self, session_id: str, message: str, context: str = "") -> str:
+        return "".join([chunk async for chunk in self.stream(session_id, message, context)])
+
+    def snapshot(self) -> dict:
+        return {
+            "model": self.model,
+            "streams": self.streams,
+            "first_token_seconds_avg": self.first_token_seconds_total / self.streams if self.streams else 0.0,
+        }
+
+class StubChatProvider:
+    """Keyword answers streamed word by word, so tests and keyless installs never leave the process"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def reply(self, session_id: str, message: str, context: str = "") -> str:
+        return keyword_response(message)
+
+    async def stream(self, session_id: str, message: str, context: str = ""):
+        words = keyword_response(message).split(" ")
+        for i, word in enumerate(words):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield word if i == len(words) - 1 else word + " "
+
+    def snapshot(self) -> dict:
+        return {}
+
+if CHAT_PROVIDER == "litellm" and LITELLM_AVAILABLE and CHAT_API_KEY:
+    chat_provider = LiteLlmChatProvider(CHAT_MODEL, CHAT_API_KEY, CHAT_API_BASE)
+elif CHAT_PROVIDER == "llm" and LLM_AVAILABLE and EMERGENT_LLM_KEY:
+    chat_provider = LlmChatProvider(
+        EMERGENT_LLM_KEY, CHAT_SESSION_POOL_SIZE, CHAT_SESSION_TTL, max_turns=CHAT_CONTEXT_TURNS
+    )
+else:
+    chat_provider = StubChatProvider()
+
+def set_chat_provider(provider):
+    """Swap the chat backend (e.g. a slow or failing stub in tests)"""
+    global chat_provider
+    chat_provider = provider
+
+# Turns read from chat_history when a session is not in memory; those beyond
+# CHAT_CONTEXT_TURNS only feed the summary
+CHAT_CONTEXT_LOAD_TURNS = 30
+CHAT_CONTEXT_MESSAGE_CHARS = 500
+
+class ChatSessionContext:
+    """Recent turns of one conversation plus a summary of everything older"""
+
+    __slots__ = ("turns", "summary")
+
+    def __init__(self, turns: list = (), summary: str = ""):
+        self.turns = deque(turns)
+        self.summary = summary
+
+    def add_turn(self, user_message: str, assistant_response: str):
+        self.turns.append({"user_message": user_message, "assistant_response": assistant_response})
+        overflow = []
+        while len(self.turns) > CHAT_CONTEXT_TURNS:
+            overflow.append(self.turns.popleft())
+        if overflow:
+            self.summary = summarize_turns(overflow, self.summary)
+
+    def prompt(self) -> str:
+        """Context block prepended to the user's message, empty for a new conversation"""
+        lines = []
+        if self.summary:
+            lines.append(f"Earlier in this conversation the user asked about: {self.summary}")
+        if self.turns:
+            lines.append("Most recent exchanges:")
+        for turn in self.turns:
+            lines.append(f"User: {turn['user_message'][:CHAT_CONTEXT_MESSAGE_CHARS]}")
+            lines.append(f"Assistant: {turn['assistant_response'][:CHAT_CONTEXT_MESSAGE_CHARS]}")
+        return "\n".join(lines)
+
+def summarize_turns(turns: list, previous: str = "") -> str:
+    """Extractive summary: the first sentence of each user message, newest kept within the cap"""
+    points = [previous] if previous else []
+    for turn in turns:
+        sentence = re.split(r"(?<=[.?!])\s", turn["user_message"].strip(), maxsplit=1)[0]
+        if sentence:
+            points.append(sentence[:200])
+    summary = "; ".join(points)
+    if len(summary) > CHAT_CONTEXT_SUMMARY_CHARS:
+        summary = "..." + summary[-(CHAT_CONTEXT_SUMMARY_CHARS - 3):]
+    return summary
+
+chat_context_cache = TTLCache(CHAT_CONTEXT_SESSIONS, CHAT_CONTEXT_TTL)
+
+async def load_chat_context(session_id: str, known_session: bool) -> ChatSessionContext:
+    """Context for a session from memory, or rebuilt from its latest chat_history turns"""
+    context = chat_context_cache.get(session_id)
+    if context is not None:
+        return context
+    turns = []
+    if known_session and CHAT_CONTEXT_TURNS > 0:
+        turns = await db.chat_history.find(
+            {"session_id": session_id},
+            {"_id": 0, "user_message": 1, "assistant_response": 1}
+        ).sort("timestamp", -1).limit(CHAT_CONTEXT_LOAD_TURNS).to_list(CHAT_CONTEXT_LOAD_TURNS)
+        turns.reverse()
+    context = ChatSessionContext()
+    for turn in turns:
+        context.add_turn(turn.get("user_message", ""), turn.get("assistant_response", ""))
+    chat_context_cache.set(session_id, context)
+    return context
+
+async def remember_chat_turn(session_id: str, context: ChatSessionContext, message: str, response: str):
+    """Persist an exchange and add it to the session's in-memory context"""
+    if CHAT_CONTEXT_TURNS > 0:
+        context.add_turn(message, response)
+        chat_context_cache.set(session_id, context)
+    await record_chat_turn({
+        "session_id": session_id,
+        "user_message": message,
+        "assistant_response": response,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    })
+
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat_with_assistant(chat_input: ChatMessage):
     session_id = chat_input.session_id or str(uuid.uuid4())
+    context = await load_chat_context(session_id, chat_input.session_id is not None)
+    prompt_context = context.prompt()
     
-    # Fallback responses for common questions
-    fallback_responses = {
-        "price": "Our solar systems range from ₹5,999 for a 3kW home system to ₹2,75,000 for industrial 250kW installations. Use our Solar Calculator for a personalized estimate!",
-        "size": "The right system size depends on your electricity bill. A typical home uses 3-10kW, while commercial properties need 25-250kW. Try our Solar Calculator!",
-        "warranty": "All our solar systems come with 25-30 year warranties. Premium brands like SunPower and LG offer extended performance guarantees.",
-        "install": "Installation typically takes 1-3 days for homes and 1-2 weeks for commercial projects. Our vendors handle permits and grid connection.",
-        "save": "On average, solar can reduce your electricity bills by 70-90%. Your exact savings depend on your consumption and system size.",
-        "default": "Thanks for your question! I'm your SolarSavers assistant. For personalized recommendations, try our Solar Calculator or browse our products. How can I help you with solar energy today?"
-    }
-    
-    # Generate response
-    message_lower = chat_input.message.lower()
-    response = fallback_responses["default"]
-    
-    if LLM_AVAILABLE and EMERGENT_LLM_KEY:
+    # Cached answers are context-free, so only an opening question may use one
+    question = normalize_question(chat_input.message) if not prompt_context else None
+    response = chat_answer_cache.get(question) if question else None
+    if response is None:
         try:
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=session_id,
-                system_message=SOLAR_SYSTEM_PROMPT
+            response = await asyncio.wait_for(
+                chat_provider.reply(session_id, chat_input.message, prompt_context), CHAT_TIMEOUT
             )
-            chat.with_model("openai", "gpt-4")
-            
-            user_message = UserMessage(text=chat_input.message)
-            response = await chat.send_message(user_message)
+            if question:
+                chat_answer_cache.set(question, response)
         except Exception as e:
-            logging.error(f"LLM Chat error: {e}")
+            logging.error(f"LLM Chat error: {e!r}")
             # Fall through to keyword-based response
-            for key in ["price", "cost", "size", "kw", "warranty", "install", "save", "bill"]:
-                if key in message_lower:
-                    if key in ["price", "cost"]:
-                        response = fallback_responses["price"]
-                    elif key in ["size", "kw"]:
-                        response = fallback_responses["size"]
-                    elif key == "warranty":
-                        response = fallback_responses["warranty"]
-                    elif key == "install":
-                        response = fallback_responses["install"]
-                    elif key in ["save", "bill"]:
-                        response = fallback_responses["save"]
-                    break
-    else:
-        # Keyword-based fallback
-        for key in ["price", "cost", "size", "kw", "warranty", "install", "save", "bill"]:
-            if key in message_lower:
-                if key in ["price", "cost"]:
-                    response = fallback_responses["price"]
-                elif key in ["size", "kw"]:
-                    response = fallback_responses["size"]
-                elif key == "warranty":
-                    response = fallback_responses["warranty"]
-                elif key == "install":
-                    response = fallback_responses["install"]
-                elif key in ["save", "bill"]:
-                    response = fallback_responses["save"]
-                break
+            response = keyword_response(chat_input.message)
     
     # Store chat history
-    await db.chat_history.insert_one({
-        "session_id": session_id,
-        "user_message": chat_input.message,
-        "assistant_response": response,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
+    await remember_chat_turn(session_id, context, chat_input.message, response)
     
     return ChatResponse(response=response, session_id=session_id)
 
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@api_router.post("/chat/stream")
+async def chat_stream(chat_input: ChatMessage):
+    """Server-sent events: `session`, then `delta` chunks as they arrive, then `done`.
+
+    The whole exchange is bounded by CHAT_TIMEOUT. If the provider fails or times
+    out before sending anything, the keyword answer is streamed instead; after
+    partial output an `error` event ends the stream.
+    """
+    session_id = chat_input.session_id or str(uuid.uuid4())
+    context = await load_chat_context(session_id, chat_input.session_id is not None)
+    prompt_context = context.prompt()
+    # Cached answers are context-free, so only an opening question may use one
+    question = normalize_question(chat_input.message) if not prompt_context else None
+    
+    async def cached_stream(answer: str):
+        yield answer
+    
+    async def events():
+        yield sse_event({"session_id": session_id}, "session")
+        chunks = []
+        deadline = time.monotonic() + CHAT_TIMEOUT
+        cached = chat_answer_cache.get(question) if question else None
+        cacheable = question is not None and cached is None
+        stream = (
+            cached_stream(cached) if cached is not None
+            else chat_provider.stream(session_id, chat_input.message, prompt_context)
+        )
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                chunks.append(chunk)
+                yield sse_event({"delta": chunk}, "delta")
+        except Exception as e:
+            logging.error(f"LLM Chat stream error: {e!r}")
+            if chunks:
+                yield sse_event({"message": "The assistant stopped responding"}, "error")
+                return
+            chunks = [keyword_response(chat_input.message)]
+            yield sse_event({"delta": chunks[0]}, "delta")
+            cacheable = False
+        finally:
+            await stream.aclose()
+        
+        response = "".join(chunks)
+        if cacheable:
+            chat_answer_cache.set(question, response)
+        await remember_chat_turn(session_id, context, chat_input.message, response)
+        yield sse_event({"session_id": session_id}, "done")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ============== CONTACT ==============
 
 @api_router.post("/contact")
@@ -876,6 +2381,78 @@ async def submit_contact(form: ContactForm):
 
 # ============== REVIEWS ==============
 
+REVIEW_STARS = (1, 2, 3, 4, 5)
+
+def rating_update_pipeline(rating: int) -> list:
+    """Update pipeline adding one review to a product's running rating aggregates.
+
+    Expects the aggregates to exist (see backfill_rating_aggregates).
+    """
+    return [
+        {"$set": {
+            "rating_sum": {"$add": [{"$ifNull": ["$rating_sum", 0]}, rating]},
+            "review_count": {"$add": [{"$ifNull": ["$review_count", 0]}, 1]},
+            f"rating_histogram.{rating}": {"$add": [{"$ifNull": [f"$rating_histogram.{rating}", 0]}, 1]},
+            "updated_at": {"$literal": datetime.now(timezone.utc).isoformat()},
+        }},
+        {"$set": {"rating": {"$round": [{"$divide": ["$rating_sum", "$review_count"]}, 1]}}},
+    ]
+
+async def backfill_rating_aggregates(product_id: str, session=None):
+    """Start the running aggregates of a product that predates them from its stored reviews.
+
+    Products reviewed before aggregates were kept have a review_count and rating
+    but no rating_sum; seeded products have neither reviews nor rating_sum and
+    start from zero. Only applied while rating_sum is still missing.
+    """
+    stats = await db.reviews.aggregate([
+        {"$match": {"product_id": product_id}},
+        {"$group": {
+            "_id": None,
+            "rating_sum": {"$sum": "$rating"},
+            "review_count": {"$sum": 1},
+            **{f"stars_{n}": {"$sum": {"$cond": [{"$eq": ["$rating", n]}, 1, 0]}} for n in REVIEW_STARS}
+        }},
+    ], session=session).to_list(1)
+    stats = stats[0] if stats else {}
+    await db.products.update_one(
+        {"id": product_id, "rating_sum": {"$exists": False}},
+        {"$set": {
+            "rating_sum": stats.get("rating_sum", 0),
+            "review_count": stats.get("review_count", 0),
+            "rating_histogram": {str(n): stats.get(f"stars_{n}", 0) for n in REVIEW_STARS},
+        }},
+        session=session
+    )
+
+async def repair_product_ratings() -> dict:
+    """Recompute every reviewed product's rating aggregates from the reviews collection.
+
+    Runs server-side as one aggregation merged into products on `id`, to correct
+    drift or backfill products reviewed before aggregates were kept incrementally.
+    """
+    await db.reviews.aggregate([
+        {"$group": {
+            "_id": "$product_id",
+            "rating_sum": {"$sum": "$rating"},
+            "review_count": {"$sum": 1},
+            **{f"stars_{n}": {"$sum": {"$cond": [{"$eq": ["$rating", n]}, 1, 0]}} for n in REVIEW_STARS}
+        }},
+        {"$project": {
+            "_id": 0,
+            "id": "$_id",
+            "rating_sum": 1,
+            "review_count": 1,
+            "rating": {"$round": [{"$divide": ["$rating_sum", "$review_count"]}, 1]},
+            "rating_histogram": {str(n): f"$stars_{n}" for n in REVIEW_STARS},
+            "updated_at": {"$literal": datetime.now(timezone.utc).isoformat()}
+        }},
+        {"$merge": {"into": "products", "on": "id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ]).to_list(None)
+    invalidate_catalog()
+    repaired = await db.products.count_documents({"rating_sum": {"$exists": True}})
+    return {"message": "Product ratings recomputed", "products_with_reviews": repaired}
+
 @api_router.post("/reviews")
 async def create_review(review: ReviewCreate, current_user: dict = Depends(get_current_user)):
     review_id = str(uuid.uuid4())
@@ -888,67 +2465,274 @@ async def create_review(review: ReviewCreate, current_user: dict = Depends(get_c
         "comment": review.comment,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.reviews.insert_one(review_doc)
+    if review.rating not in REVIEW_STARS:
+        raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
     
-    # Update product rating
-    reviews = await db.reviews.find({"product_id": review.product_id}).to_list(1000)
-    avg_rating = sum(r["rating"] for r in reviews) / len(reviews)
-    await db.products.update_one(
-        {"id": review.product_id},
-        {"$set": {"rating": round(avg_rating, 1), "review_count": len(reviews)}}
-    )
+    # Insert the review and fold it into the product's running aggregates together
+    async def record(session=None):
+        product = await db.products.find_one({"id": review.product_id}, {"_id": 0, "rating_sum": 1}, session=session)
+        if product is not None and "rating_sum" not in product:
+            # Before the insert, so the new review is counted once
+            await backfill_rating_aggregates(review.product_id, session)
+        await db.reviews.insert_one(review_doc, session=session)
+        await db.products.update_one(
+            {"id": review.product_id}, rating_update_pipeline(review.rating), session=session
+        )
+    
+    if await transactions_supported():
+        async with await client.start_session() as session:
+            await session.with_transaction(record)
+    else:
+        await record()
+    invalidate_catalog(review.product_id)
     
     return {"message": "Review submitted", "id": review_id}
 
+@api_router.post("/admin/maintenance/repair-ratings")
+async def repair_ratings(current_user: dict = Depends(get_admin_user)):
+    """Recompute product rating aggregates from stored reviews (admin only)"""
+    return await repair_product_ratings()
+
 @api_router.get("/reviews/{product_id}")
-async def get_product_reviews(product_id: str):
-    reviews = await db.reviews.find({"product_id": product_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return reviews
+async def get_product_reviews(
+    product_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    return await fetch_page(
+        db.reviews, {"product_id": product_id}, {"_id": 0}, "created_at", -1, limit, cursor, response
+    )
 
 # ============== BRANDS ==============
 
 @api_router.get("/brands")
-async def get_brands():
-    brands = await db.products.distinct("brand")
-    return brands
+async def get_brands(request: Request):
+    async def build():
+        brands = await db.products.distinct("brand")
+        return orjson.dumps(brands), {}
+    
+    return await cached_catalog_response(request, ("brands",), build)
 
-# ============== DASHBOARD STATS ==============
+# ============== DASHBOARD ROLLUPS ==============
+
+# Dashboard totals are kept in dashboard_rollups and updated as orders change:
+#   {"id": "global"} and {"id": "vendor:<vendor_id>"} hold orders, revenue,
+#   status_counts.<status> (and assigned_orders for vendors);
+#   {"id": "<scope>:<YYYY-MM-DD>", "scope": ..., "day": ...} hold daily orders/revenue.
+# Vendor figures follow the vendor dashboard: orders containing the vendor's
+# products and revenue from the vendor's own lines.
+
+# Order fields needed to compute rollup deltas
+ROLLUP_ORDER_FIELDS = {"_id": 0, "status": 1, "items": 1, "total_amount": 1, "assigned_vendor_id": 1, "created_at": 1}
+
+def _vendor_line_revenue(order: dict) -> dict:
+    revenue = {}
+    for item in order.get("items", []):
+        vendor_id = item.get("vendor_id")
+        if vendor_id:
+            revenue[vendor_id] = revenue.get(vendor_id, 0) + item["price"] * item["quantity"]
+    return revenue
+
+def _rollup_inc(rollup_id: str, inc: dict, scope: Optional[str] = None, day: Optional[str] = None) -> UpdateOne:
+    on_insert = {"scope": scope or rollup_id}
+    if day:
+        on_insert["day"] = day
+    return UpdateOne({"id": rollup_id}, {"$inc": inc, "$setOnInsert": on_insert}, upsert=True)
+
+def new_order_deltas(order: dict) -> list:
+    """(rollup_id, increments, scope, day) for every rollup a new order touches"""
+    day = order["created_at"][:10]
+    status_field = f"status_counts.{order['status']}"
+    deltas = [
+        ("global", {"orders": 1, "revenue": order["total_amount"], status_field: 1}, None, None),
+        (f"global:{day}", {"orders": 1, "revenue": order["total_amount"]}, "global", day),
+    ]
+    for vendor_id, revenue in _vendor_line_revenue(order).items():
+        scope = f"vendor:{vendor_id}"
+        deltas.append((scope, {"orders": 1, "revenue": revenue, status_field: 1}, None, None))
+        deltas.append((f"{scope}:{day}", {"orders": 1, "revenue": revenue}, scope, day))
+    return deltas
+
+def rollup_ops_for_new_order(order: dict) -> list:
+    return [_rollup_inc(*delta) for delta in new_order_deltas(order)]
+
+def rollup_ops_for_status_change(previous: dict, new_status: str) -> list:
+    old_status = previous.get("status")
+    if old_status == new_status:
+        return []
+    move = {f"status_counts.{old_status}": -1, f"status_counts.{new_status}": 1}
+    scopes = ["global"] + [f"vendor:{vendor_id}" for vendor_id in _vendor_line_revenue(previous)]
+    return [_rollup_inc(scope, move) for scope in scopes]
+
+def rollup_ops_for_assignment(previous: dict, vendor_id: str) -> list:
+    ops = rollup_ops_for_status_change(previous, "assigned")
+    old_vendor_id = previous.get("assigned_vendor_id")
+    if old_vendor_id != vendor_id:
+        ops.append(_rollup_inc(f"vendor:{vendor_id}", {"assigned_orders": 1}))
+        if old_vendor_id:
+            ops.append(_rollup_inc(f"vendor:{old_vendor_id}", {"assigned_orders": -1}))
+    return ops
+
+async def apply_rollup_ops(ops: list):
+    # The order write already succeeded; a failed rollup update is repaired by a rebuild
+    if not ops:
+        return
+    try:
+        await db.dashboard_rollups.bulk_write(ops, ordered=False)
+    except Exception as e:
+        logging.error(f"Dashboard rollup update failed, run rebuild-rollups: {e}")
+
+async def rebuild_dashboard_rollups() -> dict:
+    """Recompute every rollup from the orders collection in one streaming pass.
+
+    Rollups are replaced in place, so dashboards and concurrent $inc upserts
+    never see an empty collection or create duplicate ids. Orders written while
+    the rebuild runs may be missed; run it when writes are quiet.
+    """
+    rollups = {}
+    # Only rollups that existed before the scan are candidates for removal;
+    # ones upserted by concurrent writes are left alone
+    existing_ids = {doc["id"] async for doc in db.dashboard_rollups.find({}, {"_id": 0, "id": 1}).batch_size(1000)}
+
+    def bump(rollup_id: str, inc: dict, scope: Optional[str] = None, day: Optional[str] = None):
+        doc = rollups.setdefault(rollup_id, {"id": rollup_id, "scope": scope or rollup_id, "orders": 0, "revenue": 0})
+        if day:
+            doc["day"] = day
+        for field, amount in inc.items():
+            if field.startswith("status_counts."):
+                counts = doc.setdefault("status_counts", {})
+                status = field.split(".", 1)[1]
+                counts[status] = counts.get(status, 0) + amount
+            else:
+                doc[field] = doc.get(field, 0) + amount
+
+    orders_seen = 0
+    async for order in db.orders.find({}, ROLLUP_ORDER_FIELDS).batch_size(1000):
+        orders_seen += 1
+        for delta in new_order_deltas(order):
+            bump(*delta)
+        if order.get("assigned_vendor_id"):
+            bump(f"vendor:{order['assigned_vendor_id']}", {"assigned_orders": 1})
+
+    # Dashboards only trust rollups once the global document is marked complete
+    rollups.setdefault("global", {"id": "global", "scope": "global", "orders": 0, "revenue": 0})
+    rollups["global"]["complete"] = True
+    rollups["global"]["rebuilt_at"] = datetime.now(timezone.utc).isoformat()
+
+    docs = list(rollups.values())
+    ops = [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs]
+    stale_ids = sorted(existing_ids - rollups.keys())
+    ops += [DeleteMany({"id": {"$in": stale_ids[start:start + 1000]}}) for start in range(0, len(stale_ids), 1000)]
+    for start in range(0, len(ops), 1000):
+        await db.dashboard_rollups.bulk_write(ops[start:start + 1000], ordered=False)
+    return {"message": "Dashboard rollups rebuilt", "orders": orders_seen, "rollups": len(docs)}
+
+async def order_stats_by_status(match: dict) -> dict:
+    """Order count and revenue per status, computed server-side"""
+    rows = await db.orders.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$status", "orders": {"$sum": 1}, "revenue": {"$sum": "$total_amount"}}}
+    ]).to_list(None)
+    return {row["_id"]: row for row in rows}
+
+async def vendor_line_stats(vendor_id: str) -> dict:
+    """Orders containing a vendor's products, by status, plus revenue from the vendor's own lines"""
+    rows = await db.orders.aggregate([
+        {"$match": {"items.vendor_id": vendor_id}},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "orders": {"$sum": 1}}}],
+            "revenue": [
+                {"$unwind": "$items"},
+                {"$match": {"items.vendor_id": vendor_id}},
+                {"$group": {"_id": None, "total": {"$sum": {"$multiply": ["$items.price", "$items.quantity"]}}}}
+            ]
+        }}
+    ]).to_list(1)
+    facets = rows[0] if rows else {"by_status": [], "revenue": []}
+    return {
+        "by_status": {row["_id"]: row["orders"] for row in facets["by_status"]},
+        "revenue": facets["revenue"][0]["total"] if facets["revenue"] else 0
+    }
 
 @api_router.get("/vendor/dashboard")
-async def get_vendor_dashboard(current_user: dict = Depends(get_vendor_user)):
-    products = await db.products.count_documents({"vendor_id": current_user["id"]})
-    orders = await db.orders.find({"items.vendor_id": current_user["id"]}, {"_id": 0}).to_list(1000)
-    
-    total_revenue = sum(
-        sum(item["price"] * item["quantity"] for item in o["items"] if item.get("vendor_id") == current_user["id"])
-        for o in orders
+async def get_vendor_dashboard(current_user: dict = Depends(get_token_vendor)):
+    products, global_rollup, rollup = await asyncio.gather(
+        db.products.count_documents({"vendor_id": current_user["id"]}),
+        db.dashboard_rollups.find_one({"id": "global"}, {"_id": 0, "complete": 1}),
+        db.dashboard_rollups.find_one({"id": f"vendor:{current_user['id']}"}, {"_id": 0})
     )
     
+    if global_rollup and global_rollup.get("complete"):
+        rollup = rollup or {}
+        return {
+            "total_products": products,
+            "total_orders": rollup.get("orders", 0),
+            "total_revenue": round(rollup.get("revenue", 0), 2),
+            "pending_orders": rollup.get("status_counts", {}).get("pending", 0)
+        }
+    
+    # Rollups not built yet: aggregate from orders
+    stats = await vendor_line_stats(current_user["id"])
     return {
         "total_products": products,
-        "total_orders": len(orders),
-        "total_revenue": round(total_revenue, 2),
-        "pending_orders": len([o for o in orders if o["status"] == "pending"])
+        "total_orders": sum(stats["by_status"].values()),
+        "total_revenue": round(stats["revenue"], 2),
+        "pending_orders": stats["by_status"].get("pending", 0)
     }
 
 @api_router.get("/admin/dashboard")
-async def get_admin_dashboard(current_user: dict = Depends(get_admin_user)):
-    users = await db.users.count_documents({"role": "customer"})
-    vendors = await db.users.count_documents({"role": "vendor"})
-    products = await db.products.count_documents({})
-    orders = await db.orders.find({}, {"_id": 0}).to_list(1000)
+async def get_admin_dashboard(current_user: dict = Depends(get_token_admin)):
+    users, vendors, products, rollup = await asyncio.gather(
+        db.users.count_documents({"role": "customer"}),
+        db.users.count_documents({"role": "vendor"}),
+        db.products.count_documents({}),
+        db.dashboard_rollups.find_one({"id": "global"}, {"_id": 0})
+    )
     
-    total_revenue = sum(o["total_amount"] for o in orders)
+    if rollup and rollup.get("complete"):
+        return {
+            "total_customers": users,
+            "total_vendors": vendors,
+            "total_products": products,
+            "total_orders": rollup.get("orders", 0),
+            "total_revenue": round(rollup.get("revenue", 0), 2),
+            "pending_orders": rollup.get("status_counts", {}).get("pending", 0)
+        }
     
+    # Rollups not built yet: aggregate from orders
+    by_status = await order_stats_by_status({})
     return {
         "total_customers": users,
         "total_vendors": vendors,
         "total_products": products,
-        "total_orders": len(orders),
-        "total_revenue": round(total_revenue, 2),
-        "pending_orders": len([o for o in orders if o["status"] == "pending"])
+        "total_orders": sum(row["orders"] for row in by_status.values()),
+        "total_revenue": round(sum(row["revenue"] for row in by_status.values()), 2),
+        "pending_orders": by_status.get("pending", {}).get("orders", 0)
     }
 
+async def daily_rollups(scope: str, days: int) -> list:
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date().isoformat()
+    return await db.dashboard_rollups.find(
+        {"scope": scope, "day": {"$gte": since}},
+        {"_id": 0, "day": 1, "orders": 1, "revenue": 1}
+    ).sort("day", 1).to_list(days)
+
+@api_router.get("/admin/dashboard/daily")
+async def get_admin_daily_stats(days: int = Query(30, ge=1, le=366), current_user: dict = Depends(get_token_admin)):
+    """Orders and revenue per day, oldest first (days without orders are omitted)"""
+    return await daily_rollups("global", days)
+
+@api_router.get("/vendor/dashboard/daily")
+async def get_vendor_daily_stats(days: int = Query(30, ge=1, le=366), current_user: dict = Depends(get_token_vendor)):
+    """Orders containing the vendor's products and their line revenue per day"""
+    return await daily_rollups(f"vendor:{current_user['id']}", days)
+
+@api_router.post("/admin/maintenance/rebuild-rollups")
+async def rebuild_rollups(current_user: dict = Depends(get_admin_user)):
+    """Recompute dashboard rollups from orders (admin only)"""
+    return await rebuild_dashboard_rollups()
+
 # ============== SEED DATA ==============
 
 @api_router.post("/seed")
@@ -964,7 +2748,7 @@ async def seed_data():
         "id": admin_id,
         "email": "admin@solarsavers.com",
         "name": "Admin",
-        "password": hash_password("admin123"),
+        "password": await hash_password("admin123"),
         "role": "admin",
         "created_at": datetime.now(timezone.utc).isoformat()
     }
@@ -976,7 +2760,7 @@ async def seed_data():
         "id": vendor_id,
         "email": "vendor@solarsavers.com",
         "name": "SolarTech Solutions",
-        "password": hash_password("vendor123"),
+        "password": await hash_password("vendor123"),
         "role": "vendor",
         "business_name": "SolarTech Solutions",
         "description": "Premium solar panel manufacturer",
@@ -1153,26 +2937,50 @@ async def seed_data():
     ]
     
     await db.products.insert_many(products)
+    invalidate_catalog()
     
     return {"message": "Database seeded successfully", "products_count": len(products)}
 
 # ============== MVSP VENDOR INVENTORY ==============
 
 @api_router.get("/vendor/inventory", response_model=List[VendorInventoryResponse])
-async def get_vendor_inventory(current_user: dict = Depends(get_vendor_user)):
-    """Get all products in vendor's inventory"""
-    inventory = await db.vendor_inventory.find(
-        {"vendor_id": current_user["id"]}, {"_id": 0}
-    ).to_list(100)
+async def get_vendor_inventory(
+    response: Response,
+    available: Optional[bool] = None,
+    low_stock: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_vendor_user)
+):
+    """Get products in vendor's inventory, newest first.
+
+    `available` filters on is_available, `low_stock` keeps rows with at most that
+    quantity. Pass the X-Next-Cursor header value as `cursor` for the next page.
+    """
+    query = {"vendor_id": current_user["id"]}
+    if available is not None:
+        query["is_available"] = available
+    if low_stock is not None:
+        query["quantity"] = {"$lte": low_stock}
     
-    response = []
+    inventory = await fetch_page(db.vendor_inventory, query, {"_id": 0}, "created_at", -1, limit, cursor, response)
+    
+    # Product names and prices for the whole page in one query
+    product_ids = list({item["product_id"] for item in inventory})
+    products = await db.products.find(
+        {"id": {"$in": product_ids}}, {"_id": 0, "id": 1, "name": 1, "price": 1}
+    ).to_list(len(product_ids))
+    products_by_id = {p["id"]: p for p in products}
+    
+    vendor_name = current_user.get("business_name", current_user["name"])
+    result = []
     for item in inventory:
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
+        product = products_by_id.get(item["product_id"])
         if product:
-            response.append(VendorInventoryResponse(
+            result.append(VendorInventoryResponse(
                 id=item["id"],
                 vendor_id=item["vendor_id"],
-                vendor_name=current_user.get("business_name", current_user["name"]),
+                vendor_name=vendor_name,
                 product_id=item["product_id"],
                 product_name=product["name"],
                 quantity=item["quantity"],
@@ -1182,7 +2990,7 @@ async def get_vendor_inventory(current_user: dict = Depends(get_vendor_user)):
                 location=item.get("location"),
                 updated_at=item.get("updated_at", item.get("created_at", ""))
             ))
-    return response
+    return result
 
 @api_router.post("/vendor/inventory", response_model=VendorInventoryResponse)
 async def add_to_inventory(
@@ -1309,7 +3117,7 @@ async def suggest_product(
     return {"message": "Product suggestion submitted for approval", "id": suggestion_id}
 
 @api_router.get("/admin/product-suggestions")
-async def get_product_suggestions(current_user: dict = Depends(get_admin_user)):
+async def get_product_suggestions(current_user: dict = Depends(get_token_admin)):
     """Get all pending product suggestions"""
     suggestions = await db.product_suggestions.find(
         {"status": "pending"}, {"_id": 0}
@@ -1350,7 +3158,9 @@ async def approve_product_suggestion(
         "is_approved": True,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    product_doc["updated_at"] = product_doc["created_at"]
     await db.products.insert_one(product_doc)
+    invalidate_catalog(product_id)
     
     # Update suggestion status
     await db.product_suggestions.update_one(
@@ -1377,69 +3187,112 @@ async def reject_product_suggestion(
 
 # ============== ADMIN ORDER ASSIGNMENT ==============
 
-@api_router.get("/admin/orders/pending-assignment")
-async def get_orders_pending_assignment(current_user: dict = Depends(get_admin_user)):
-    """Get orders that need vendor assignment"""
-    orders = await db.orders.find(
-        {"assigned_vendor_id": {"$exists": False}},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return orders
+ORDER_SUMMARY_PROJECTION = {
+    "id": 1, "user_id": 1, "total_amount": 1, "status": 1, "assigned_vendor_id": 1, "created_at": 1,
+    "items.product_id": 1, "items.name": 1, "items.quantity": 1,
+}
+
+@api_router.get("/admin/orders/pending-assignment", response_model=List[OrderSummary])
+async def get_orders_pending_assignment(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_token_admin)
+):
+    """Get summaries of orders that need vendor assignment (`fields=all` for full orders)"""
+    selection = FieldSelection(fields, OrderSummary, OrderResponse, "created_at", ORDER_SUMMARY_PROJECTION)
+    orders = await fetch_page(
+        db.orders, {"assigned_vendor_id": {"$exists": False}}, selection.projection,
+        "created_at", -1, limit, cursor, response
+    )
+    return json_list_response(selection.serialize(orders), response)
+
+# ============== VENDOR MATCHING ==============
+
+def order_quantities(order: dict) -> dict:
+    """Total quantity needed per product across the order's lines"""
+    needed = {}
+    for item in order.get("items", []):
+        needed[item["product_id"]] = needed.get(item["product_id"], 0) + item["quantity"]
+    return needed
+
+def vendor_match_pipeline(needed: dict, top_k: int, location: Optional[str] = None) -> list:
+    """Aggregation over vendor_inventory that finds vendors able to fill the whole order.
+
+    A vendor qualifies when it is approved and has an available row with enough
+    stock for every product. Qualifying vendors are joined with their user record
+    and ranked by matching location (when given), then by total vendor price for
+    the order.
+    """
+    needed_quantity = {"$switch": {
+        "branches": [{"case": {"$eq": ["$product_id", pid]}, "then": qty} for pid, qty in needed.items()],
+        "default": 0
+    }}
+    pipeline = [
+        # Each branch is served by the (product_id, is_available, quantity) index
+        {"$match": {"$or": [
+            {"product_id": pid, "is_available": True, "quantity": {"$gte": qty}}
+            for pid, qty in needed.items()
+        ]}},
+        {"$group": {
+            "_id": "$vendor_id",
+            "products": {"$addToSet": "$product_id"},
+            "total_vendor_price": {"$sum": {"$multiply": ["$vendor_price", needed_quantity]}},
+            "stock_locations": {"$addToSet": {"$toLower": {"$ifNull": ["$location", ""]}}}
+        }},
+        {"$match": {"products": {"$size": len(needed)}}},
+        {"$lookup": {"from": "users", "localField": "_id", "foreignField": "id", "as": "vendor"}},
+        {"$unwind": "$vendor"},
+        {"$match": {"vendor.role": "vendor", "vendor.status": "approved"}},
+    ]
+    sort = {"total_vendor_price": 1, "_id": 1}
+    if location:
+        wanted = location.lower().strip()
+        pipeline.append({"$addFields": {"location_match": {"$cond": [
+            {"$or": [
+                {"$eq": [{"$toLower": {"$ifNull": ["$vendor.location", ""]}}, wanted]},
+                {"$in": [wanted, "$stock_locations"]}
+            ]}, 1, 0
+        ]}}})
+        sort = {"location_match": -1, **sort}
+    pipeline += [
+        {"$sort": sort},
+        {"$limit": top_k},
+        {"$project": {
+            "_id": 0,
+            "vendor_id": "$_id",
+            "vendor_name": {"$ifNull": ["$vendor.business_name", "$vendor.name"]},
+            "total_vendor_price": 1,
+            "location": {"$ifNull": ["$vendor.location", None]},
+            "email": "$vendor.email"
+        }},
+    ]
+    return pipeline
+
+async def match_vendors_for_order(order: dict, top_k: int = 20, location: Optional[str] = None) -> list:
+    needed = order_quantities(order)
+    if not needed:
+        return []
+    pipeline = vendor_match_pipeline(needed, top_k, location)
+    return await db.vendor_inventory.aggregate(pipeline).to_list(top_k)
 
 @api_router.get("/admin/orders/{order_id}/available-vendors")
 async def get_available_vendors_for_order(
     order_id: str,
-    current_user: dict = Depends(get_admin_user)
+    top_k: int = Query(20, ge=1, le=100),
+    location: Optional[str] = None,
+    current_user: dict = Depends(get_token_admin)
 ):
-    """Get list of vendors who have the products in this order"""
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    """Vendors with enough stock for every product in this order, cheapest first.
+
+    Vendors in `location` (vendor profile or stock location) are ranked ahead of the rest.
+    """
+    order = await db.orders.find_one({"id": order_id}, {"_id": 0, "items": 1, "total_amount": 1})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    # Get product IDs from order
-    product_ids = [item["product_id"] for item in order.get("items", [])]
-    
-    # Find vendors who have ALL these products in their inventory
-    vendor_inventory = await db.vendor_inventory.find(
-        {
-            "product_id": {"$in": product_ids},
-            "is_available": True,
-            "quantity": {"$gt": 0}
-        },
-        {"_id": 0}
-    ).to_list(500)
-    
-    # Group by vendor
-    vendor_products = {}
-    for inv in vendor_inventory:
-        vid = inv["vendor_id"]
-        if vid not in vendor_products:
-            vendor_products[vid] = {
-                "products": [],
-                "total_price": 0
-            }
-        vendor_products[vid]["products"].append(inv["product_id"])
-        # Find quantity needed for this product
-        for item in order["items"]:
-            if item["product_id"] == inv["product_id"]:
-                vendor_products[vid]["total_price"] += inv["vendor_price"] * item["quantity"]
-    
-    # Get vendor details for those who have ALL products
-    available_vendors = []
-    for vid, data in vendor_products.items():
-        if all(pid in data["products"] for pid in product_ids):
-            vendor = await db.users.find_one({"id": vid}, {"_id": 0, "password": 0})
-            if vendor:
-                available_vendors.append({
-                    "vendor_id": vid,
-                    "vendor_name": vendor.get("business_name", vendor["name"]),
-                    "total_vendor_price": data["total_price"],
-                    "location": vendor.get("location"),
-                    "email": vendor["email"]
-                })
-    
-    # Sort by price (lowest first)
-    available_vendors.sort(key=lambda x: x["total_vendor_price"])
+    available_vendors = await match_vendors_for_order(order, top_k, location)
     
     return {
         "order_id": order_id,
@@ -1447,56 +3300,218 @@ async def get_available_vendors_for_order(
         "available_vendors": available_vendors
     }
 
+class StockShortage(Exception):
+    """Raised inside a reservation transaction to abort it"""
+
+    def __init__(self, failed_lines: Optional[list]):
+        super().__init__("Insufficient stock")
+        self.failed_lines = failed_lines
+
+async def stock_shortfalls(vendor_id: str, needed: dict, session=None) -> list:
+    """Order lines the vendor cannot currently cover, with the quantity on hand"""
+    rows = await db.vendor_inventory.find(
+        {"vendor_id": vendor_id, "product_id": {"$in": list(needed)}},
+        {"_id": 0, "product_id": 1, "quantity": 1},
+        session=session
+    ).to_list(len(needed))
+    on_hand = {row["product_id"]: row["quantity"] for row in rows}
+    return [
+        {"product_id": pid, "needed": qty, "available": on_hand.get(pid, 0)}
+        for pid, qty in needed.items()
+        if on_hand.get(pid, 0) < qty
+    ]
+
+class AssignmentConflict(Exception):
+    """The order was assigned elsewhere or dispatched while this assignment ran"""
+
+# Orders in these states keep their vendor
+ASSIGNMENT_LOCKED_STATUSES = ["shipped", "delivered", "completed", "cancelled"]
+
+def assignable_order_filter(order_id: str, current_vendor_id: Optional[str]) -> dict:
+    """Matches the order only while it still has the vendor it was read with"""
+    return {
+        "id": order_id,
+        "assigned_vendor_id": current_vendor_id,  # None also matches a missing field
+        "status": {"$nin": ASSIGNMENT_LOCKED_STATUSES},
+    }
+
+def release_stock_ops(vendor_id: str, needed: dict) -> list:
+    return [
+        UpdateOne({"vendor_id": vendor_id, "product_id": pid}, {"$inc": {"quantity": qty}})
+        for pid, qty in needed.items()
+    ]
+
+async def reserve_and_assign_in_transaction(
+    order_id: str, vendor_id: str, current_vendor_id: Optional[str], needed: dict, assignment_fields: dict
+) -> dict:
+    """Move the order's stock from its current vendor (if any) to `vendor_id` and
+    assign the order, all or nothing.
+
+    Returns the order as it was before assignment (ROLLUP_ORDER_FIELDS).
+    """
+    # Orders without items have no stock to move
+    moves_stock = vendor_id != current_vendor_id and bool(needed)
+    ops = [
+        UpdateOne(
+            {"vendor_id": vendor_id, "product_id": pid, "quantity": {"$gte": qty}},
+            {"$inc": {"quantity": -qty}}
+        )
+        for pid, qty in needed.items()
+    ]
+
+    async def reserve(session):
+        if moves_stock:
+            failed = await stock_shortfalls(vendor_id, needed, session)
+            if failed:
+                raise StockShortage(failed)
+            result = await db.vendor_inventory.bulk_write(ops, ordered=False, session=session)
+            if result.modified_count != len(ops):
+                raise StockShortage(None)
+        previous = await db.orders.find_one_and_update(
+            assignable_order_filter(order_id, current_vendor_id), {"$set": assignment_fields},
+            ROLLUP_ORDER_FIELDS, session=session
+        )
+        if previous is None:
+            raise AssignmentConflict()
+        if moves_stock and current_vendor_id:
+            await db.vendor_inventory.bulk_write(
+                release_stock_ops(current_vendor_id, needed), ordered=False, session=session
+            )
+        return previous
+
+    async with await client.start_session() as session:
+        # with_transaction retries transient write conflicts from concurrent assignments
+        return await session.with_transaction(reserve)
+
+async def reserve_and_assign_with_compensation(
+    order_id: str, vendor_id: str, current_vendor_id: Optional[str], needed: dict, assignment_fields: dict
+) -> dict:
+    """Same contract without transactions (standalone mongod).
+
+    Each decremented row is tagged with a token unique to this attempt, so a
+    partially applied bulk write or a lost race for the order can be undone
+    without touching stock taken by a concurrent attempt. Tags are removed once
+    the order is assigned.
+    """
+    # Orders without items have no stock to move
+    moves_stock = vendor_id != current_vendor_id and bool(needed)
+    marker = f"reservations.{uuid.uuid4().hex}"
+
+    async def give_back():
+        await db.vendor_inventory.bulk_write([
+            UpdateOne(
+                {"vendor_id": vendor_id, "product_id": pid, marker: {"$exists": True}},
+                {"$inc": {"quantity": qty}, "$unset": {marker: ""}}
+            )
+            for pid, qty in needed.items()
+        ], ordered=False)
+
+    if moves_stock:
+        failed = await stock_shortfalls(vendor_id, needed)
+        if failed:
+            raise StockShortage(failed)
+        result = await db.vendor_inventory.bulk_write([
+            UpdateOne(
+                {"vendor_id": vendor_id, "product_id": pid, "quantity": {"$gte": qty}},
+                {"$inc": {"quantity": -qty}, "$set": {marker: qty}}
+            )
+            for pid, qty in needed.items()
+        ], ordered=False)
+        if result.modified_count != len(needed):
+            # Lost a race for some line: give back whatever this attempt took
+            await give_back()
+            raise StockShortage(None)
+
+    previous = await db.orders.find_one_and_update(
+        assignable_order_filter(order_id, current_vendor_id), {"$set": assignment_fields}, ROLLUP_ORDER_FIELDS
+    )
+    if previous is None:
+        if moves_stock:
+            await give_back()
+        raise AssignmentConflict()
+
+    if moves_stock:
+        if current_vendor_id:
+            try:
+                await db.vendor_inventory.bulk_write(release_stock_ops(current_vendor_id, needed), ordered=False)
+            except Exception as e:
+                logging.error(f"Order {order_id}: stock not returned to vendor {current_vendor_id}: {e}")
+        await db.vendor_inventory.update_many(
+            {"vendor_id": vendor_id, marker: {"$exists": True}}, {"$unset": {marker: ""}}
+        )
+    return previous
+
 @api_router.put("/admin/orders/{order_id}/assign")
 async def assign_order_to_vendor(
     order_id: str,
     assignment: OrderAssignment,
     current_user: dict = Depends(get_admin_user)
 ):
-    """Assign an order to a specific vendor"""
+    """Assign (or reassign) an order to a specific vendor, reserving its stock.
+
+    Reassigning returns the stock to the previous vendor. Fails with 409 and the
+    lines the vendor cannot cover, or when the order was assigned or dispatched
+    concurrently; stock never goes negative.
+    """
     # Verify order exists
-    order = await db.orders.find_one({"id": order_id})
+    order = await db.orders.find_one(
+        {"id": order_id}, {"_id": 0, "items": 1, "status": 1, "assigned_vendor_id": 1}
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    if order.get("status") in ASSIGNMENT_LOCKED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Order is {order['status']} and can no longer be reassigned")
     
     # Verify vendor exists
     vendor = await db.users.find_one({"id": assignment.vendor_id, "role": "vendor"})
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
     
-    # Update order with assignment
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {
-            "assigned_vendor_id": assignment.vendor_id,
-            "assigned_vendor_name": vendor.get("business_name", vendor["name"]),
-            "assigned_by": current_user["id"],
-            "assignment_notes": assignment.assignment_notes,
-            "assigned_at": datetime.now(timezone.utc).isoformat(),
-            "status": "assigned"
-        }}
-    )
+    assignment_fields = {
+        "assigned_vendor_id": assignment.vendor_id,
+        "assigned_vendor_name": vendor.get("business_name", vendor["name"]),
+        "assigned_by": current_user["id"],
+        "assignment_notes": assignment.assignment_notes,
+        "assigned_at": datetime.now(timezone.utc).isoformat(),
+        "status": "assigned"
+    }
+    needed = order_quantities(order)
+    current_vendor_id = order.get("assigned_vendor_id")
     
-    # Reduce vendor inventory
-    for item in order.get("items", []):
-        await db.vendor_inventory.update_one(
-            {
-                "vendor_id": assignment.vendor_id,
-                "product_id": item["product_id"]
-            },
-            {"$inc": {"quantity": -item["quantity"]}}
-        )
+    try:
+        if await transactions_supported():
+            previous = await reserve_and_assign_in_transaction(
+                order_id, assignment.vendor_id, current_vendor_id, needed, assignment_fields
+            )
+        else:
+            previous = await reserve_and_assign_with_compensation(
+                order_id, assignment.vendor_id, current_vendor_id, needed, assignment_fields
+            )
+    except StockShortage as e:
+        failed_lines = e.failed_lines or await stock_shortfalls(assignment.vendor_id, needed)
+        message = "Vendor does not have enough stock for this order"
+        if not failed_lines:
+            message = "Stock changed during assignment, please retry"
+        raise HTTPException(status_code=409, detail={"message": message, "failed_lines": failed_lines})
+    except AssignmentConflict:
+        raise HTTPException(status_code=409, detail="Order changed during assignment, reload it and retry")
+    
+    await apply_rollup_ops(rollup_ops_for_assignment(previous, assignment.vendor_id))
     
     return {"message": f"Order assigned to {vendor.get('business_name', vendor['name'])}"}
 
 @api_router.get("/vendor/assigned-orders")
-async def get_vendor_assigned_orders(current_user: dict = Depends(get_vendor_user)):
+async def get_vendor_assigned_orders(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_vendor)
+):
     """Get orders assigned to this vendor"""
-    orders = await db.orders.find(
-        {"assigned_vendor_id": current_user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return orders
+    return await fetch_page(
+        db.orders, {"assigned_vendor_id": current_user["id"]}, {"_id": 0},
+        "created_at", -1, limit, cursor, response
+    )
 
 # ============== CONTACT & TICKETING ==============
 
@@ -1514,10 +3529,14 @@ async def submit_contact_form(form: ContactForm):
     return {"message": "Thank you for contacting us! We'll respond shortly.", "id": contact_id}
 
 @api_router.get("/admin/contacts")
-async def get_contact_submissions(current_user: dict = Depends(get_admin_user)):
+async def get_contact_submissions(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_admin)
+):
     """Get all contact form submissions (admin)"""
-    contacts = await db.contacts.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return contacts
+    return await fetch_page(db.contacts, {}, {"_id": 0}, "created_at", -1, limit, cursor, response)
 
 @api_router.post("/tickets", response_model=TicketResponse)
 async def create_ticket(ticket: TicketCreate, current_user: dict = Depends(get_current_user)):
@@ -1532,32 +3551,100 @@ async def create_ticket(ticket: TicketCreate, current_user: dict = Depends(get_c
         **ticket.model_dump(),
         "status": "open",
         "priority": "medium",
-        "replies": [],
+        "reply_count": 0,
         "created_at": now,
         "updated_at": now
     }
     await db.tickets.insert_one(ticket_doc)
     return TicketResponse(**{k: v for k, v in ticket_doc.items() if k != "_id"})
 
-@api_router.get("/tickets", response_model=List[TicketResponse])
-async def get_user_tickets(current_user: dict = Depends(get_current_user)):
+# Replies live in ticket_replies; tickets keep only reply_count and last_reply_at.
+# Tickets from before the split may still carry an embedded `replies` array until
+# migrate_ticket_replies has run, so list projections always exclude it. Such a
+# ticket has no reply_count; reads fall back to the embedded thread, and the first
+# new reply migrates it.
+TICKET_SUMMARY_PROJECTION = {"_id": 0, "replies": 0}
+TICKET_REPLY_PROJECTION = {"_id": 0, "ticket_id": 0}
+
+def embedded_reply_counters(replies: list) -> dict:
+    return {
+        "reply_count": len(replies),
+        "last_reply_at": max((r["created_at"] for r in replies if r.get("created_at")), default=None),
+    }
+
+async def embedded_replies(ticket_id: str) -> list:
+    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0, "replies": 1})
+    return (ticket or {}).get("replies") or []
+
+async def fill_unmigrated_reply_counters(tickets: list) -> list:
+    """Set reply_count/last_reply_at from the embedded thread on tickets not yet migrated"""
+    unmigrated = [t for t in tickets if "reply_count" not in t]
+    if unmigrated:
+        rows = await db.tickets.find(
+            {"id": {"$in": [t["id"] for t in unmigrated]}}, {"_id": 0, "id": 1, "replies.created_at": 1}
+        ).to_list(None)
+        threads = {row["id"]: row.get("replies") or [] for row in rows}
+        for ticket in unmigrated:
+            ticket.update(embedded_reply_counters(threads.get(ticket["id"], [])))
+    return tickets
+
+@api_router.get("/tickets", response_model=List[TicketSummary])
+async def get_user_tickets(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_principal)
+):
     """Get current user's tickets"""
-    tickets = await db.tickets.find(
-        {"user_id": current_user["id"]},
-        {"_id": 0}
-    ).sort("updated_at", -1).to_list(100)
-    return [TicketResponse(**t) for t in tickets]
+    tickets = await fetch_page(
+        db.tickets, {"user_id": current_user["id"]}, model_projection(TicketSummary), "updated_at", -1, limit, cursor, response
+    )
+    await fill_unmigrated_reply_counters(tickets)
+    return json_list_response(trusted_json(TicketSummary, tickets), response)
 
-@api_router.get("/tickets/{ticket_id}", response_model=TicketResponse)
-async def get_ticket(ticket_id: str, current_user: dict = Depends(get_current_user)):
-    """Get a specific ticket"""
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
+async def get_visible_ticket(ticket_id: str, current_user: dict) -> dict:
+    """Ticket summary, if it exists and the user may see it"""
+    ticket = await db.tickets.find_one({"id": ticket_id}, TICKET_SUMMARY_PROJECTION)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     # Users can only see their own tickets, admins can see all
     if ticket["user_id"] != current_user["id"] and current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Access denied")
-    return TicketResponse(**ticket)
+    return ticket
+
+@api_router.get("/tickets/{ticket_id}", response_model=TicketResponse)
+async def get_ticket(
+    ticket_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_token_principal)
+):
+    """Get a specific ticket with the first page of its thread"""
+    ticket = await get_visible_ticket(ticket_id, current_user)
+    if "reply_count" not in ticket:
+        # Not migrated yet: the whole thread is still embedded in the ticket
+        replies = await embedded_replies(ticket_id)
+        return TicketResponse(**ticket, **embedded_reply_counters(replies), replies=replies)
+    replies = await fetch_page(
+        db.ticket_replies, {"ticket_id": ticket_id}, TICKET_REPLY_PROJECTION, "created_at", 1, limit, None, response
+    )
+    return TicketResponse(**ticket, replies=replies)
+
+@api_router.get("/tickets/{ticket_id}/replies")
+async def get_ticket_replies(
+    ticket_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_principal)
+):
+    """Page through a ticket's thread, oldest first (continue with X-Next-Cursor)"""
+    ticket = await get_visible_ticket(ticket_id, current_user)
+    if "reply_count" not in ticket:
+        return await embedded_replies(ticket_id)
+    return await fetch_page(
+        db.ticket_replies, {"ticket_id": ticket_id}, TICKET_REPLY_PROJECTION, "created_at", 1, limit, cursor, response
+    )
 
 @api_router.post("/tickets/{ticket_id}/reply")
 async def reply_to_ticket(
@@ -1566,7 +3653,7 @@ async def reply_to_ticket(
     current_user: dict = Depends(get_current_user)
 ):
     """Add a reply to a ticket"""
-    ticket = await db.tickets.find_one({"id": ticket_id})
+    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0, "id": 1, "user_id": 1, "replies": 1})
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
@@ -1574,35 +3661,95 @@ async def reply_to_ticket(
     if ticket["user_id"] != current_user["id"] and current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Access denied")
     
+    # Move an embedded thread out first, so the new reply is counted on top of it
+    if "replies" in ticket:
+        await migrate_ticket(ticket)
+    
+    now = datetime.now(timezone.utc).isoformat()
     reply_doc = {
         "id": str(uuid.uuid4()),
         "user_id": current_user["id"],
         "user_name": current_user["name"],
         "is_admin": current_user["role"] == "admin",
         "message": reply.message,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": now
     }
     
+    # Insert the reply and bump the ticket's counters together
+    async def record(session=None):
+        await db.ticket_replies.insert_one({**reply_doc, "ticket_id": ticket_id}, session=session)
+        await db.tickets.update_one(
+            {"id": ticket_id},
+            {"$inc": {"reply_count": 1}, "$set": {"last_reply_at": now, "updated_at": now}},
+            session=session
+        )
+    
+    if await transactions_supported():
+        async with await client.start_session() as session:
+            await session.with_transaction(record)
+    else:
+        await record()
+    return {"message": "Reply added successfully", "reply": reply_doc}
+
+async def migrate_ticket(ticket: dict) -> int:
+    """Move one ticket's embedded `replies` into ticket_replies; returns how many it held"""
+    replies = ticket.get("replies") or []
+    for reply in replies:
+        reply.setdefault("id", str(uuid.uuid4()))
+    if replies:
+        await db.ticket_replies.bulk_write([
+            UpdateOne({"id": r["id"]}, {"$setOnInsert": {**r, "ticket_id": ticket["id"]}}, upsert=True)
+            for r in replies
+        ], ordered=False)
+    reply_count = await db.ticket_replies.count_documents({"ticket_id": ticket["id"]})
+    last_reply = await db.ticket_replies.find(
+        {"ticket_id": ticket["id"]}, {"_id": 0, "created_at": 1}
+    ).sort(keyset_sort("created_at", -1)).limit(1).to_list(1)
     await db.tickets.update_one(
-        {"id": ticket_id},
+        {"id": ticket["id"]},
         {
-            "$push": {"replies": reply_doc},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+            "$set": {
+                "reply_count": reply_count,
+                "last_reply_at": last_reply[0]["created_at"] if last_reply else None,
+            },
+            "$unset": {"replies": ""},
         }
     )
-    return {"message": "Reply added successfully", "reply": reply_doc}
+    return len(replies)
 
-@api_router.get("/admin/tickets", response_model=List[TicketResponse])
+async def migrate_ticket_replies() -> dict:
+    """Move embedded ticket replies into ticket_replies and set the ticket counters.
+
+    Idempotent: replies are upserted by id, and the embedded array is only removed
+    once its replies are stored, so an interrupted run can simply be repeated.
+    """
+    migrated_tickets = 0
+    moved_replies = 0
+    async for ticket in db.tickets.find({"replies": {"$exists": True}}, {"_id": 0, "id": 1, "replies": 1}):
+        moved_replies += await migrate_ticket(ticket)
+        migrated_tickets += 1
+    return {"message": "Ticket replies migrated", "tickets": migrated_tickets, "replies": moved_replies}
+
+@api_router.post("/admin/maintenance/migrate-ticket-replies")
+async def migrate_ticket_replies_route(current_user: dict = Depends(get_admin_user)):
+    """Move replies embedded in ticket documents into ticket_replies (admin only)"""
+    return await migrate_ticket_replies()
+
+@api_router.get("/admin/tickets", response_model=List[TicketSummary])
 async def get_all_tickets(
+    response: Response,
     status: Optional[str] = None,
-    current_user: dict = Depends(get_admin_user)
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_admin)
 ):
     """Get all tickets (admin only)"""
     query = {}
     if status:
         query["status"] = status
-    tickets = await db.tickets.find(query, {"_id": 0}).sort("updated_at", -1).to_list(100)
-    return [TicketResponse(**t) for t in tickets]
+    tickets = await fetch_page(db.tickets, query, model_projection(TicketSummary), "updated_at", -1, limit, cursor, response)
+    await fill_unmigrated_reply_counters(tickets)
+    return json_list_response(trusted_json(TicketSummary, tickets), response)
 
 @api_router.put("/admin/tickets/{ticket_id}/status")
 async def update_ticket_status(
@@ -1642,28 +3789,44 @@ async def update_ticket_priority(
 
 # ============== BLOG ENDPOINTS ==============
 
-@api_router.get("/blogs", response_model=List[BlogResponse])
-async def get_blogs(category: Optional[str] = None, published_only: bool = True):
-    """Get all blogs, optionally filtered by category"""
+@api_router.get("/blogs", response_model=List[BlogSummary])
+async def get_blogs(
+    request: Request,
+    response: Response,
+    category: Optional[str] = None,
+    published_only: bool = True,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Get blog summaries (no `content` unless selected with `fields`), optionally filtered by category"""
     query = {}
     if published_only:
         query["is_published"] = True
     if category:
         query["category"] = category
-    blogs = await db.blogs.find(query, {"_id": 0}).sort("created_at", -1).to_list(50)
-    return [BlogResponse(**b) for b in blogs]
+    selection = FieldSelection(fields, BlogSummary, BlogResponse, "created_at")
+    blogs = await fetch_page(db.blogs, query, selection.projection, "created_at", -1, limit, cursor, response)
+    headers = {}
+    if NEXT_CURSOR_HEADER in response.headers:
+        headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return conditional_response(request, selection.serialize(blogs), headers)
 
 @api_router.get("/blogs/{blog_id}", response_model=BlogResponse)
-async def get_blog(blog_id: str):
-    """Get a single blog by ID and increment views"""
-    blog = await db.blogs.find_one_and_update(
-        {"id": blog_id},
-        {"$inc": {"views": 1}},
-        {"_id": 0}
-    )
+async def get_blog(blog_id: str, request: Request):
+    """Get a single blog by ID and count the view (written to the database in batches)"""
+    blog = await db.blogs.find_one({"id": blog_id}, {"_id": 0})
     if not blog:
         raise HTTPException(status_code=404, detail="Blog not found")
-    return BlogResponse(**blog)
+    blog_view_counter.increment(blog_id)
+    blog["views"] = blog.get("views", 0) + blog_view_counter.pending(blog_id)
+    # The view count changes on every read, so the validator tracks edits only
+    version = hashlib.blake2b(f"{blog_id}:{blog.get('updated_at')}".encode(), digest_size=16).hexdigest()
+    headers = {"ETag": f'W/"{version}"'}
+    last_modified = http_date(blog.get("updated_at"))
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return conditional_response(request, BlogResponse(**blog).model_dump_json().encode(), headers)
 
 @api_router.post("/admin/blogs", response_model=BlogResponse)
 async def create_blog(blog: BlogCreate, current_user: dict = Depends(get_admin_user)):
@@ -1709,10 +3872,422 @@ async def delete_blog(blog_id: str, current_user: dict = Depends(get_admin_user)
     return {"message": "Blog deleted successfully"}
 
 @api_router.get("/admin/blogs", response_model=List[BlogResponse])
-async def get_all_blogs_admin(current_user: dict = Depends(get_admin_user)):
+async def get_all_blogs_admin(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_admin)
+):
     """Get all blogs including unpublished (admin only)"""
-    blogs = await db.blogs.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return [BlogResponse(**b) for b in blogs]
+    blogs = await fetch_page(db.blogs, {}, model_projection(BlogResponse), "created_at", -1, limit, cursor, response)
+    return json_list_response(trusted_json(BlogResponse, blogs), response)
+
+# ============== INDEXES ==============
+
+# Bump whenever INDEX_SPECS changes so deployments can tell which set is applied
+INDEX_SET_VERSION = 7
+
+# Every collection is looked up by its public `id`
+INDEX_SPECS = {
+    "users": [
+        ([("id", 1)], {"unique": True}),
+        ([("email", 1)], {"unique": True}),
+        ([("role", 1)], {}),
+    ],
+    "products": [
+        ([("id", 1)], {"unique": True}),
+        ([("vendor_id", 1)], {}),
+        ([("created_at", -1), ("id", -1)], {}),
+        ([("category", 1), ("created_at", -1), ("id", -1), ("price", 1)], {}),
+        ([("brand", 1), ("created_at", -1), ("id", -1), ("price", 1)], {}),
+        ([("in_stock", 1), ("rating", -1)], {}),
+        ([("in_stock", 1), ("category", 1), ("rating", -1)], {}),
+        ([("name", "text"), ("description", "text"), ("brand", "text"), ("features", "text")],
+         {"weights": {"name": 10, "brand": 5, "features": 3, "description": 1}}),
+    ],
+    "orders": [
+        ([("id", 1)], {"unique": True}),
+        ([("created_at", -1), ("id", -1)], {}),
+        ([("user_id", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("items.vendor_id", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("assigned_vendor_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ],
+    "vendor_inventory": [
+        ([("id", 1)], {"unique": True}),
+        ([("vendor_id", 1), ("product_id", 1)], {"unique": True}),
+        ([("vendor_id", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("product_id", 1), ("is_available", 1), ("quantity", 1)], {}),
+    ],
+    "product_suggestions": [
+        ([("id", 1)], {"unique": True}),
+        ([("status", 1)], {}),
+    ],
+    "reviews": [
+        ([("id", 1)], {"unique": True}),
+        ([("product_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ],
+    "contacts": [
+        ([("id", 1)], {"unique": True}),
+        ([("created_at", -1), ("id", -1)], {}),
+    ],
+    "tickets": [
+        ([("id", 1)], {"unique": True}),
+        ([("updated_at", -1), ("id", -1)], {}),
+        ([("user_id", 1), ("updated_at", -1), ("id", -1)], {}),
+        ([("status", 1), ("updated_at", -1), ("id", -1)], {}),
+    ],
+    "ticket_replies": [
+        ([("id", 1)], {"unique": True}),
+        ([("ticket_id", 1), ("created_at", 1), ("id", 1)], {}),
+    ],
+    "chat_history": [
+        ([("session_id", 1), ("timestamp", -1)], {}),
+    ],
+    "dashboard_rollups": [
+        ([("id", 1)], {"unique": True}),
+        ([("scope", 1), ("day", 1)], {}),
+    ],
+    "blogs": [
+        ([("id", 1)], {"unique": True}),
+        ([("created_at", -1), ("id", -1)], {}),
+        ([("is_published", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("is_published", 1), ("category", 1), ("created_at", -1), ("id", -1)], {}),
+    ],
+}
+
+# Indexes from earlier index sets that a newer spec supersedes. They are dropped
+# after their replacements are built, so every query keeps an index throughout.
+RETIRED_INDEXES = {
+    "products": [
+        [("category", 1), ("price", 1)],
+        [("brand", 1), ("price", 1)],
+    ],
+    "orders": [
+        [("created_at", -1)],
+        [("user_id", 1), ("created_at", -1)],
+        [("items.vendor_id", 1), ("created_at", -1)],
+        [("assigned_vendor_id", 1), ("created_at", -1)],
+    ],
+    "reviews": [[("product_id", 1), ("created_at", -1)]],
+    "contacts": [[("created_at", -1)]],
+    "tickets": [
+        [("updated_at", -1)],
+        [("user_id", 1), ("updated_at", -1)],
+        [("status", 1), ("updated_at", -1)],
+    ],
+    "blogs": [
+        [("created_at", -1)],
+        [("is_published", 1), ("created_at", -1)],
+        [("is_published", 1), ("category", 1), ("created_at", -1)],
+    ],
+}
+
+# Query shapes issued by the routes: equality fields, sort keys and range fields.
+# `check` mode refuses to start if any of these has no index serving it.
+QUERY_SHAPES = [
+    {"route": "get_current_user", "collection": "users", "equality": ["id"]},
+    {"route": "login", "collection": "users", "equality": ["email"]},
+    {"route": "get_vendors", "collection": "users", "equality": ["role"]},
+    {"route": "get_vendor", "collection": "users", "equality": ["id", "role"]},
+    {"route": "get_product", "collection": "products", "equality": ["id"]},
+    {"route": "create_order", "collection": "products", "equality": ["id"]},
+    {"route": "get_vendor_products", "collection": "products", "equality": ["vendor_id"]},
+    {"route": "get_products", "collection": "products", "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_products", "collection": "products", "equality": ["category"], "sort": [("created_at", -1), ("id", -1)], "range": ["price"]},
+    {"route": "get_products", "collection": "products", "equality": ["brand"], "sort": [("created_at", -1), ("id", -1)], "range": ["price"]},
+    {"route": "search_products", "collection": "products", "text": True},
+    {"route": "search_products", "collection": "products", "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_featured_products", "collection": "products", "equality": ["in_stock"], "sort": [("rating", -1)]},
+    {"route": "get_featured_products", "collection": "products", "equality": ["in_stock", "category"], "sort": [("rating", -1)]},
+    {"route": "get_orders", "collection": "orders", "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_orders", "collection": "orders", "equality": ["user_id"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_vendor_orders", "collection": "orders", "equality": ["items.vendor_id"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_vendor_assigned_orders", "collection": "orders", "equality": ["assigned_vendor_id"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_orders_pending_assignment", "collection": "orders", "equality": ["assigned_vendor_id"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "update_order_status", "collection": "orders", "equality": ["id", "assigned_vendor_id"]},
+    {"route": "get_vendor_inventory", "collection": "vendor_inventory", "equality": ["vendor_id"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "add_to_inventory", "collection": "vendor_inventory", "equality": ["vendor_id", "product_id"]},
+    {"route": "update_inventory", "collection": "vendor_inventory", "equality": ["id", "vendor_id"]},
+    {"route": "match_vendors_for_order", "collection": "vendor_inventory", "equality": ["product_id", "is_available"], "range": ["quantity"]},
+    {"route": "match_vendors_for_order", "collection": "users", "equality": ["id"]},
+    {"route": "get_product_suggestions", "collection": "product_suggestions", "equality": ["status"]},
+    {"route": "get_product_reviews", "collection": "reviews", "equality": ["product_id"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_contact_submissions", "collection": "contacts", "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_user_tickets", "collection": "tickets", "equality": ["user_id"], "sort": [("updated_at", -1), ("id", -1)]},
+    {"route": "get_all_tickets", "collection": "tickets", "sort": [("updated_at", -1), ("id", -1)]},
+    {"route": "get_all_tickets", "collection": "tickets", "equality": ["status"], "sort": [("updated_at", -1), ("id", -1)]},
+    {"route": "get_ticket", "collection": "tickets", "equality": ["id"]},
+    {"route": "get_ticket_replies", "collection": "ticket_replies", "equality": ["ticket_id"], "sort": [("created_at", 1), ("id", 1)]},
+    {"route": "migrate_ticket_replies", "collection": "ticket_replies", "equality": ["id"]},
+    {"route": "get_blogs", "collection": "blogs", "equality": ["is_published"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_blogs", "collection": "blogs", "equality": ["is_published", "category"], "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_all_blogs_admin", "collection": "blogs", "sort": [("created_at", -1), ("id", -1)]},
+    {"route": "get_blog", "collection": "blogs", "equality": ["id"]},
+    {"route": "load_chat_context", "collection": "chat_history", "equality": ["session_id"], "sort": [("timestamp", -1)]},
+    {"route": "get_admin_dashboard", "collection": "dashboard_rollups", "equality": ["id"]},
+    {"route": "daily_rollups", "collection": "dashboard_rollups", "equality": ["scope"], "range": ["day"]},
+]
+
+# build: create missing indexes at startup, check: also fail startup on gaps, off: skip
+INDEX_BOOTSTRAP_MODE = os.environ.get('INDEX_BOOTSTRAP_MODE', 'build')
+
+def index_name(keys: list) -> str:
+    """Default MongoDB index name for a key list, e.g. user_id_1_created_at_-1"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+def index_serves_shape(keys: list, options: dict, shape: dict) -> bool:
+    """Whether an index can answer a query shape without a collection scan"""
+    # $text queries need the collection's text index, which serves nothing else
+    is_text_index = any(direction == "text" for _, direction in keys)
+    if shape.get("text") or is_text_index:
+        return bool(shape.get("text")) and is_text_index
+
+    fields = [field for field, _ in keys]
+    equality = shape.get("equality", [])
+    sort = shape.get("sort", [])
+    ranges = shape.get("range", [])
+
+    # A unique index fully pinned by equality matches at most one document
+    if options.get("unique") and set(fields) <= set(equality):
+        return True
+
+    # Equality fields must form the index prefix (in any order)
+    if set(fields[:len(equality)]) != set(equality):
+        return False
+    remaining = keys[len(equality):]
+
+    # Sort keys follow the equality prefix, all in index order or all reversed
+    if sort:
+        head = remaining[:len(sort)]
+        if [field for field, _ in head] != [field for field, _ in sort]:
+            return False
+        same = all(d1 == d2 for (_, d1), (_, d2) in zip(head, sort))
+        reversed_ = all(d1 == -d2 for (_, d1), (_, d2) in zip(head, sort))
+        if not (same or reversed_):
+            return False
+        remaining = remaining[len(sort):]
+
+    # Range fields only need to be somewhere in what is left of the index
+    if ranges:
+        rest = [field for field, _ in remaining]
+        if not sort and (not rest or rest[0] != ranges[0]):
+            return False
+        if ranges[0] not in rest:
+            return False
+
+    return bool(equality or sort or ranges)
+
+def find_uncovered_query_shapes() -> List[dict]:
+    """Query shapes in QUERY_SHAPES that no declared index serves"""
+    uncovered = []
+    for shape in QUERY_SHAPES:
+        specs = INDEX_SPECS.get(shape["collection"], [])
+        if not any(index_serves_shape(keys, options, shape) for keys, options in specs):
+            uncovered.append(shape)
+    return uncovered
+
+async def ensure_indexes(mode: str = "build") -> dict:
+    """Create any missing index from INDEX_SPECS and record the applied version.
+
+    Safe to run on every startup: existing indexes are detected and skipped.
+    In `check` mode a missing index or an unserved query shape raises RuntimeError.
+    """
+    total = sum(len(specs) for specs in INDEX_SPECS.values())
+    report = {"version": INDEX_SET_VERSION, "built": [], "existing": [], "failed": [], "missing": []}
+    position = 0
+
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        for keys, options in specs:
+            position += 1
+            name = f"{collection_name}.{index_name(keys)}"
+            if index_name(keys) in existing:
+                report["existing"].append(name)
+                continue
+            if mode == "check":
+                report["missing"].append(name)
+                logger.error(f"Index check [{position}/{total}] {name} missing")
+                continue
+            started = time.monotonic()
+            try:
+                await collection.create_index(keys, **options)
+            except Exception as e:
+                report["failed"].append(name)
+                logger.error(f"Index build [{position}/{total}] {name} failed: {e}")
+                continue
+            report["built"].append(name)
+            logger.info(f"Index build [{position}/{total}] {name} built in {time.monotonic() - started:.2f}s")
+
+    report["dropped"] = []
+    for collection_name, retired in RETIRED_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for keys in retired:
+            name = f"{collection_name}.{index_name(keys)}"
+            if index_name(keys) not in existing:
+                continue
+            if mode == "check" or report["failed"]:
+                logger.warning(f"Retired index {name} still present")
+                continue
+            await db[collection_name].drop_index(index_name(keys))
+            report["dropped"].append(name)
+            logger.info(f"Index cleanup: dropped retired index {name}")
+
+    uncovered = find_uncovered_query_shapes()
+    for shape in uncovered:
+        logger.error(f"No index serves {shape['route']} query on {shape['collection']}: {shape}")
+    report["uncovered_shapes"] = [f"{s['route']}:{s['collection']}" for s in uncovered]
+
+    if mode == "check" and (report["missing"] or report["failed"] or uncovered):
+        raise RuntimeError(
+            f"Index check failed: missing={report['missing']} uncovered={report['uncovered_shapes']}"
+        )
+
+    if not report["failed"]:
+        await db.schema_meta.update_one(
+            {"id": "index_set"},
+            {"$set": {"version": INDEX_SET_VERSION, "applied_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True
+        )
+    logger.info(
+        f"Index set v{INDEX_SET_VERSION}: {len(report['built'])} built, "
+        f"{len(report['existing'])} existing, {len(report['failed'])} failed, "
+        f"{len(report['dropped'])} retired dropped"
+    )
+    return report
+
+# ============== METRICS ==============
+
+# Components register a callable returning their current stats
+METRICS_SOURCES = {
+    "password_hashing": password_hasher.snapshot,
+    "principal_cache": principal_cache.snapshot,
+    "weather_cache": weather_cache.snapshot,
+    "catalog_cache": catalog_cache.snapshot,
+    "chat_history_writes": chat_history_buffer.snapshot,
+    "blog_view_counts": blog_view_counter.snapshot,
+    "chat_sessions": lambda: chat_provider.snapshot(),
+    "chat_answer_cache": chat_answer_cache.snapshot,
+    "chat_context_cache": chat_context_cache.snapshot,
+    "chat_intents": lambda: intent_matcher.snapshot(),
+}
+
+@api_router.get("/admin/metrics")
+async def get_metrics(current_user: dict = Depends(get_token_admin)):
+    """In-process performance counters (admin only)"""
+    return {name: source() for name, source in METRICS_SOURCES.items()}
+
+class RequestMetrics:
+    """Request counts and latency per route template, plus requests in flight"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.counts = {}
+        self.durations = {}
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float):
+        key = (method, route, str(status_code))
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if (method, route) not in self.durations:
+            self.durations[(method, route)] = LatencyHistogram()
+        self.durations[(method, route)].observe(seconds)
+
+request_metrics = RequestMetrics()
+
+class RequestMetricsMiddleware:
+    """ASGI middleware feeding request_metrics.
+
+    Requests are labelled with the matched route's path template, never the raw
+    path, so ids and unknown URLs cannot blow up the number of series. Streaming
+    responses are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        request_metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_metrics.in_flight -= 1
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_metrics.observe(scope["method"], route, status_code, time.perf_counter() - started)
+
+def prometheus_labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+def prometheus_histogram(lines: list, name: str, histograms: dict, label_names: tuple):
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in sorted(histograms.items()):
+        labels = dict(zip(label_names, labels))
+        for le, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{prometheus_labels(**labels, le=le)} {count}")
+        lines.append(f"{name}_sum{prometheus_labels(**labels)} {histogram.sum}")
+        lines.append(f"{name}_count{prometheus_labels(**labels)} {histogram.count}")
+
+def render_prometheus() -> str:
+    """All in-process metrics in the Prometheus text exposition format"""
+    lines = [
+        "# HELP solarsaver_http_requests_total Requests by route template and status.",
+        "# TYPE solarsaver_http_requests_total counter",
+    ]
+    for (method, route, status_code), count in sorted(request_metrics.counts.items()):
+        lines.append(f"solarsaver_http_requests_total{prometheus_labels(method=method, route=route, status=status_code)} {count}")
+    lines.append("# HELP solarsaver_http_request_duration_seconds Request latency by route template.")
+    prometheus_histogram(lines, "solarsaver_http_request_duration_seconds", request_metrics.durations, ("method", "route"))
+    lines += [
+        "# HELP solarsaver_http_requests_in_flight Requests being served.",
+        "# TYPE solarsaver_http_requests_in_flight gauge",
+        f"solarsaver_http_requests_in_flight {request_metrics.in_flight}",
+    ]
+
+    with mongo_command_metrics._lock:
+        durations = dict(mongo_command_metrics.durations)
+        failures = dict(mongo_command_metrics.failures)
+    lines.append("# HELP solarsaver_mongo_command_duration_seconds MongoDB command latency by collection and command.")
+    prometheus_histogram(lines, "solarsaver_mongo_command_duration_seconds", durations, ("collection", "command"))
+    lines += [
+        "# HELP solarsaver_mongo_command_failures_total Failed MongoDB commands by collection and command.",
+        "# TYPE solarsaver_mongo_command_failures_total counter",
+    ]
+    for (collection, command), count in sorted(failures.items()):
+        lines.append(f"solarsaver_mongo_command_failures_total{prometheus_labels(collection=collection, command=command)} {count}")
+
+    # Every METRICS_SOURCES entry reporting hits/misses is a cache
+    snapshots = {name: source() for name, source in METRICS_SOURCES.items()}
+    caches = {name: stats for name, stats in snapshots.items() if "hit_ratio" in stats}
+    for metric, kind, help_text in (
+        ("hits", "counter", "Cache hits."),
+        ("misses", "counter", "Cache misses."),
+        ("hit_ratio", "gauge", "Cache hits over lookups since start."),
+        ("size", "gauge", "Cached entries."),
+    ):
+        name = f"solarsaver_cache_{metric}_total" if kind == "counter" else f"solarsaver_cache_{metric}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for cache, stats in sorted(caches.items()):
+            lines.append(f"{name}{prometheus_labels(cache=cache)} {stats[metric]}")
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus scrape endpoint (bearer METRICS_TOKEN when configured)"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
 
 # ============== ROOT ==============
 
@@ -1731,7 +4306,9 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -1739,6 +4316,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def open_http_client():
+    get_http_client()
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    if INDEX_BOOTSTRAP_MODE != "off":
+        await ensure_indexes(INDEX_BOOTSTRAP_MODE)
+
+@app.on_event("startup")
+async def start_write_buffers():
+    if CHAT_HISTORY_WRITE_MODE != "sync":
+        chat_history_buffer.start()
+    blog_view_counter.start()
+
+# Registered before shutdown_db_client so buffered records are written while the client is open
+@app.on_event("shutdown")
+async def drain_write_buffers():
+    await chat_history_buffer.stop()
+    await blog_view_counter.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    password_hasher.shutdown()
+    if http_client is not None:
+        await http_client.aclose()
+
+
+if __name__ == "__main__":
+    # Maintenance commands, e.g. python server.py indexes --check
+    commands = {
+        "indexes": lambda: ensure_indexes("check" if "--check" in sys.argv else "build"),
+        "repair-ratings": repair_product_ratings,
+        "rebuild-rollups": rebuild_dashboard_rollups,
+        "migrate-ticket-replies": migrate_ticket_replies,
+    }
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command not in commands:
+        print(f"Usage: python server.py {{{'|'.join(commands)}}}")
+        sys.exit(1)
+    print(asyncio.run(commands[command]()))
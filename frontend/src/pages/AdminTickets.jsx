@@ -44,6 +44,33 @@ const AdminTickets = () => {
         setLoading(false);
     };
 
+    // The ticket comes with the oldest page of its thread; follow X-Next-Cursor for the rest
+    const fetchTicketThread = async (ticketId) => {
+        const headers = { Authorization: `Bearer ${token}` };
+        const res = await axios.get(`${API}/api/tickets/${ticketId}?limit=200`, { headers });
+        const replies = [...res.data.replies];
+        let cursor = res.headers['x-next-cursor'];
+        while (cursor) {
+            const page = await axios.get(`${API}/api/tickets/${ticketId}/replies`, {
+                headers,
+                params: { limit: 200, cursor }
+            });
+            replies.push(...page.data);
+            cursor = page.headers['x-next-cursor'];
+        }
+        return { ...res.data, replies };
+    };
+
+    // The list only carries ticket summaries; load the thread when a ticket is opened
+    const openTicket = async (ticket) => {
+        setSelectedTicket(ticket);
+        try {
+            setSelectedTicket(await fetchTicketThread(ticket.id));
+        } catch (error) {
+            console.log('Using demo ticket thread');
+        }
+    };
+
     const updateStatus = async (ticketId, newStatus) => {
         try {
             await axios.put(`${API}/api/admin/tickets/${ticketId}/status?status=${newStatus}`, {}, {
@@ -81,10 +108,7 @@ const AdminTickets = () => {
             setReplyText('');
             fetchTickets();
             // Refetch selected ticket to show new reply
-            const res = await axios.get(`${API}/api/tickets/${selectedTicket.id}`, {
-                headers: { Authorization: `Bearer ${token}` }
-            });
-            setSelectedTicket(res.data);
+            setSelectedTicket(await fetchTicketThread(selectedTicket.id));
         } catch (error) {
             toast.error('Failed to send reply');
         }
@@ -164,7 +188,7 @@ const AdminTickets = () => {
                                     initial={{ opacity: 0, y: 10 }}
                                     animate={{ opacity: 1, y: 0 }}
                                     className="bg-card rounded-xl border p-5 hover:shadow-md transition-shadow cursor-pointer"
-                                    onClick={() => setSelectedTicket(ticket)}
+                                    onClick={() => openTicket(ticket)}
                                 >
                                     <div className="flex flex-col md:flex-row md:items-center justify-between gap-4">
                                         <div className="flex-1">
@@ -181,7 +205,7 @@ const AdminTickets = () => {
                                         </div>
                                         <div className="text-right">
                                             <p className="text-sm text-muted-foreground">{new Date(ticket.created_at).toLocaleDateString()}</p>
-                                            <p className="text-xs text-muted-foreground">{ticket.replies?.length || 0} replies</p>
+                                            <p className="text-xs text-muted-foreground">{ticket.reply_count ?? ticket.replies?.length ?? 0} replies</p>
                                         </div>
                                     </div>
                                 </motion.div>
@@ -261,7 +285,7 @@ const AdminTickets = () => {
                                     {/* Replies */}
                                     {selectedTicket.replies?.length > 0 && (
                                         <div className="space-y-3">
-                                            <p className="font-medium">Conversation ({selectedTicket.replies.length})</p>
+                                            <p className="font-medium">Conversation ({selectedTicket.reply_count ?? selectedTicket.replies.length})</p>
                                             {selectedTicket.replies.map((reply, idx) => (
                                                 <div key={idx} className={`p-3 rounded-lg ${reply.is_admin ? 'bg-primary/10 ml-4' : 'bg-muted/30 mr-4'}`}>
                                                     <div className="flex items-center gap-2 text-sm mb-1">
@@ -63,6 +63,8 @@ const ShopPage = () => {
             if (filters.maxSize < 100) params.append('max_size', filters.maxSize);
             if (filters.brands.length > 0) params.append('brand', filters.brands[0]);
             if (filters.inStock) params.append('in_stock', 'true');
+            // Listings are summaries; the search below also needs descriptions
+            if (searchQuery) params.append('fields', 'summary,description');
 
             const response = await axios.get(`${API}/api/products?${params.toString()}`);
             let data = response.data;
@@ -0,0 +1,55 @@
+"""
+Backend tests run against an in-memory MongoDB (mongomock-motor), so they need
+no database server. server.py creates its Motor client at import time, so the
+client class is swapped before the first import.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "solarsavers_test")
+os.environ.setdefault("INDEX_BOOTSTRAP_MODE", "off")
+os.environ.setdefault("WEATHER_PROVIDER", "static")
+os.environ.setdefault("CHAT_PROVIDER", "stub")
+
+import motor.motor_asyncio  # noqa: E402
+
+motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: mongomock_motor.AsyncMongoMockClient()
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    """The server module with every collection and the catalog cache emptied"""
+    async def reset():
+        for name in await server.db.list_collection_names():
+            await server.db[name].delete_many({})
+    asyncio.run(reset())
+    server.catalog_cache.clear()
+    return server
+
+
+def _without_round(expression):
+    if isinstance(expression, dict):
+        if set(expression) == {"$round"}:
+            return _without_round(expression["$round"][0])
+        return {key: _without_round(value) for key, value in expression.items()}
+    if isinstance(expression, list):
+        return [_without_round(value) for value in expression]
+    return expression
+
+
+@pytest.fixture
+def unrounded_ratings(backend, monkeypatch):
+    """mongomock has no $round; rating pipelines run with it stripped"""
+    pipeline = backend.rating_update_pipeline
+    monkeypatch.setattr(backend, "rating_update_pipeline", lambda rating: _without_round(pipeline(rating)))
+    return backend
@@ -0,0 +1,40 @@
+"""Pooled LlmChat sessions in LlmChatProvider"""
+import asyncio
+
+
+class FakeLlmChat:
+    created = []
+
+    def __init__(self, api_key, session_id, system_message):
+        self.sent = []
+        self.created.append(self)
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, message):
+        self.sent.append(message.text)
+        return f"reply {len(self.sent)}"
+
+
+class FakeUserMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_pooled_chat_gets_context_once_and_is_replaced_after_max_turns(backend, monkeypatch):
+    monkeypatch.setattr(backend, "LlmChat", FakeLlmChat, raising=False)
+    monkeypatch.setattr(backend, "UserMessage", FakeUserMessage, raising=False)
+    provider = backend.LlmChatProvider("key", pool_size=10, ttl=60, max_turns=2)
+
+    async def run():
+        for n in range(3):
+            await provider.reply("s1", f"question {n}", context=f"context {n}")
+
+    FakeLlmChat.created.clear()
+    asyncio.run(run())
+    assert [chat.sent for chat in FakeLlmChat.created] == [
+        ["context 0\n\nUser's new message: question 0", "question 1"],
+        ["context 2\n\nUser's new message: question 2"],
+    ]
+    assert provider.sessions.get("s1")["chat"] is FakeLlmChat.created[-1]
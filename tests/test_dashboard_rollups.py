@@ -0,0 +1,24 @@
+"""Dashboard rollup rebuild (POST /admin/maintenance/rebuild-rollups)"""
+import asyncio
+
+
+def test_rebuild_replaces_rollups_in_place_and_drops_stale_ones(backend):
+    async def run():
+        await backend.db.orders.insert_one({
+            "id": "o1", "user_id": "u1", "status": "pending", "total_amount": 300.0,
+            "created_at": "2025-01-01T00:00:00",
+            "items": [{"product_id": "p1", "vendor_id": "v1", "name": "Panel", "price": 100.0, "quantity": 3}],
+        })
+        await backend.db.dashboard_rollups.insert_many([
+            {"id": "global", "scope": "global", "orders": 7, "revenue": 1.0},
+            {"id": "vendor:gone", "scope": "vendor:gone", "orders": 2, "revenue": 5.0},
+        ])
+        result = await backend.rebuild_dashboard_rollups()
+        rows = await backend.db.dashboard_rollups.find({}, {"_id": 0}).to_list(None)
+        return result, {row["id"]: row for row in rows}
+
+    result, rows = asyncio.run(run())
+    assert result["rollups"] == 4
+    assert sorted(rows) == ["global", "global:2025-01-01", "vendor:v1", "vendor:v1:2025-01-01"]
+    assert rows["global"]["orders"] == 1 and rows["global"]["complete"] is True
+    assert rows["vendor:v1"]["revenue"] == 300.0
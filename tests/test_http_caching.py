@@ -0,0 +1,19 @@
+"""ETag revalidation on public catalog reads"""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+
+def test_matching_if_none_match_gets_an_empty_304(backend):
+    asyncio.run(backend.db.products.insert_one({"id": "p1", "brand": "SunPower"}))
+    with TestClient(backend.app) as client:
+        first = client.get("/api/brands")
+        etag = first.headers["ETag"]
+        revalidated = client.get("/api/brands", headers={"If-None-Match": etag})
+        weak = client.get("/api/brands", headers={"If-None-Match": f'"other", W/{etag}'})
+        stale = client.get("/api/brands", headers={"If-None-Match": '"other"'})
+
+    assert first.status_code == 200 and first.json() == ["SunPower"]
+    assert (revalidated.status_code, revalidated.content, revalidated.headers["ETag"]) == (304, b"", etag)
+    assert weak.status_code == 304
+    assert stale.status_code == 200 and stale.json() == ["SunPower"]
@@ -0,0 +1,139 @@
+"""Stock reservation when admins assign and reassign orders (PUT /admin/orders/{id}/assign)"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+ADMIN = {"id": "admin-1", "role": "admin"}
+
+
+async def seed(server, stock: dict, status: str = "pending"):
+    """Vendors v1 and v2 with `stock` units of p1 each, and a 3-unit order for p1"""
+    for vendor_id in stock:
+        await server.db.users.insert_one({"id": vendor_id, "role": "vendor", "name": vendor_id})
+        await server.db.vendor_inventory.insert_one(
+            {"id": f"inv-{vendor_id}", "vendor_id": vendor_id, "product_id": "p1", "quantity": stock[vendor_id]}
+        )
+    await server.db.orders.insert_one({
+        "id": "o1", "user_id": "u1", "status": status, "total_amount": 300.0, "created_at": "2025-01-01T00:00:00",
+        "items": [{"product_id": "p1", "vendor_id": "v1", "name": "Panel", "price": 100.0, "quantity": 3}],
+    })
+
+
+async def assign(server, vendor_id: str):
+    return await server.assign_order_to_vendor("o1", server.OrderAssignment(vendor_id=vendor_id), current_user=ADMIN)
+
+
+async def quantities(server) -> dict:
+    rows = await server.db.vendor_inventory.find({}, {"_id": 0}).to_list(None)
+    return {row["vendor_id"]: row["quantity"] for row in rows}
+
+
+class FakeTransactionSession:
+    """Runs the transaction callback directly; the mock database has no transactions"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        return await callback(None)
+
+
+@pytest.fixture(params=["compensation", "transaction"])
+def path(request, backend, monkeypatch):
+    transactions = request.param == "transaction"
+
+    async def supported():
+        return transactions
+
+    async def start_session():
+        return FakeTransactionSession()
+
+    monkeypatch.setattr(backend, "transactions_supported", supported)
+    monkeypatch.setattr(backend.client, "start_session", start_session, raising=False)
+    return backend
+
+
+def test_reassigning_to_same_vendor_reserves_once(path):
+    async def run():
+        await seed(path, {"v1": 10})
+        await assign(path, "v1")
+        await assign(path, "v1")
+        return await quantities(path)
+
+    assert asyncio.run(run()) == {"v1": 7}
+
+
+def test_reassigning_returns_stock_to_previous_vendor(path):
+    async def run():
+        await seed(path, {"v1": 10, "v2": 10})
+        await assign(path, "v1")
+        await assign(path, "v2")
+        order = await path.db.orders.find_one({"id": "o1"})
+        return await quantities(path), order["assigned_vendor_id"]
+
+    assert asyncio.run(run()) == ({"v1": 10, "v2": 7}, "v2")
+
+
+def test_dispatched_order_cannot_be_reassigned(path):
+    async def run():
+        await seed(path, {"v1": 10, "v2": 10}, status="shipped")
+        with pytest.raises(HTTPException) as error:
+            await assign(path, "v2")
+        return error.value.status_code, await quantities(path)
+
+    assert asyncio.run(run()) == (409, {"v1": 10, "v2": 10})
+
+
+def test_overlapping_assignments_keep_each_others_reservations(backend, monkeypatch):
+    """A second attempt for the same order lands between the first one's stock
+    reservation and its order update. The first attempt must give back only its
+    own stock, leaving exactly one reservation for the assigned order."""
+    async def no_transactions():
+        return False
+
+    monkeypatch.setattr(backend, "transactions_supported", no_transactions)
+    collection_class = type(backend.db.orders)
+    original = collection_class.find_one_and_update
+    interleaved = []
+
+    async def find_one_and_update(self, *args, **kwargs):
+        if self.name == "orders" and not interleaved:
+            interleaved.append(True)
+            await assign(backend, "v1")
+        return await original(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "find_one_and_update", find_one_and_update)
+
+    async def run():
+        await seed(backend, {"v1": 10})
+        with pytest.raises(HTTPException) as error:
+            await assign(backend, "v1")
+        row = await backend.db.vendor_inventory.find_one({"vendor_id": "v1"})
+        return error.value.status_code, await quantities(backend), row.get("reservations", {})
+
+    assert asyncio.run(run()) == (409, {"v1": 7}, {})
+
+
+def test_order_without_items_is_assigned_without_touching_stock(path):
+    async def run():
+        await seed(path, {"v1": 10, "v2": 10})
+        await path.db.orders.update_one({"id": "o1"}, {"$set": {"items": []}})
+        await assign(path, "v1")
+        await assign(path, "v2")
+        order = await path.db.orders.find_one({"id": "o1"})
+        return await quantities(path), order["assigned_vendor_id"]
+
+    assert asyncio.run(run()) == ({"v1": 10, "v2": 10}, "v2")
+
+
+@pytest.mark.parametrize("quantity", [0, -3])
+def test_orders_reject_non_positive_quantities(backend, quantity):
+    with pytest.raises(ValidationError):
+        backend.OrderCreate(
+            items=[{"product_id": "p1", "quantity": quantity}], shipping_address="x", payment_method="cod"
+        )
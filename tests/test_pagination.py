@@ -0,0 +1,56 @@
+"""Keyset pagination with X-Next-Cursor (GET /products and other list routes)"""
+import asyncio
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+
+def product(i: int) -> dict:
+    return {
+        "id": f"p{i}", "vendor_id": "v1", "vendor_name": "Vendor", "name": f"Panel {i}", "category": "home",
+        "system_size_kw": 5.0, "price": 1000.0 + i, "efficiency_rating": 21.0, "warranty_years": 25,
+        "brand": "Sun", "image_url": "", "in_stock": True, "created_at": f"2025-01-{i + 1:02d}T00:00:00",
+    }
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip(backend):
+    assert backend.decode_cursor(backend.encode_cursor("2025-01-01T00:00:00", "p1")) == ("2025-01-01T00:00:00", "p1")
+    assert backend.decode_cursor(backend.encode_cursor(4.5, "p1")) == (4.5, "p1")
+
+
+def test_cursor_walks_every_product_once(backend):
+    asyncio.run(backend.db.products.insert_many([product(i) for i in range(5)]))
+    seen, cursor = [], None
+    with TestClient(backend.app) as client:
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/api/products", params=params)
+            assert response.status_code == 200
+            seen += [item["id"] for item in response.json()]
+            cursor = response.headers.get(backend.NEXT_CURSOR_HEADER)
+            if not cursor:
+                break
+    assert seen == ["p4", "p3", "p2", "p1", "p0"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 json!",
+    raw_cursor({"$gt": ""}),
+    raw_cursor([{"$gt": ""}, "p1"]),
+    raw_cursor(["2025-01-01", {"$ne": None}]),
+    raw_cursor([True, "p1"]),
+    raw_cursor(["2025-01-01", "p1", "extra"]),
+])
+def test_invalid_cursor_is_rejected(backend, cursor):
+    with pytest.raises(HTTPException) as error:
+        backend.decode_cursor(cursor)
+    assert error.value.status_code == 400
+    with TestClient(backend.app) as client:
+        assert client.get("/api/products", params={"cursor": cursor}).status_code == 400
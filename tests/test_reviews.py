@@ -0,0 +1,32 @@
+"""Running rating aggregates kept on products by POST /reviews"""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+REVIEWER = {"id": "u9", "name": "Reviewer", "role": "customer"}
+
+
+def test_review_on_product_with_earlier_reviews_counts_them(unrounded_ratings):
+    """Products reviewed before rating_sum existed start from their stored reviews"""
+    backend = unrounded_ratings
+    async def seed():
+        await backend.db.products.insert_one({"id": "p1", "name": "Panel", "rating": 4.5, "review_count": 2})
+        await backend.db.reviews.insert_many([
+            {"id": "r1", "product_id": "p1", "user_id": "u1", "rating": 4},
+            {"id": "r2", "product_id": "p1", "user_id": "u2", "rating": 5},
+        ])
+
+    asyncio.run(seed())
+    backend.app.dependency_overrides[backend.get_current_user] = lambda: REVIEWER
+    try:
+        with TestClient(backend.app) as client:
+            assert client.post("/api/reviews", json={"product_id": "p1", "rating": 3, "comment": "ok"}).status_code == 200
+            assert client.post("/api/reviews", json={"product_id": "p1", "rating": 4, "comment": "good"}).status_code == 200
+    finally:
+        backend.app.dependency_overrides.clear()
+
+    product = asyncio.run(backend.db.products.find_one({"id": "p1"}, {"_id": 0}))
+    assert product["review_count"] == 4
+    assert product["rating_sum"] == 16
+    assert product["rating"] == 4.0
+    assert product["rating_histogram"] == {"1": 0, "2": 0, "3": 1, "4": 2, "5": 1}
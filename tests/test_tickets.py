@@ -0,0 +1,56 @@
+"""Ticket threads, including tickets stored before replies moved to ticket_replies"""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+OWNER = {"id": "u1", "name": "Owner", "email": "u1@test", "role": "customer"}
+
+
+def legacy_ticket() -> dict:
+    """A ticket as written before the split: replies embedded, no reply_count"""
+    return {
+        "id": "t1", "user_id": "u1", "user_name": "Owner", "user_email": "u1@test", "subject": "Inverter",
+        "message": "It beeps", "category": "technical", "status": "open", "priority": "medium",
+        "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-02T00:00:00",
+        "replies": [
+            {"id": "r1", "user_id": "admin", "user_name": "Admin", "is_admin": True,
+             "message": "Which model?", "created_at": "2025-01-01T10:00:00"},
+            {"id": "r2", "user_id": "u1", "user_name": "Owner", "is_admin": False,
+             "message": "SunPower 5kW", "created_at": "2025-01-02T00:00:00"},
+        ],
+    }
+
+
+def client_as(backend, user):
+    backend.app.dependency_overrides[backend.get_token_principal] = lambda: user
+    backend.app.dependency_overrides[backend.get_current_user] = lambda: user
+    return TestClient(backend.app)
+
+
+def test_legacy_ticket_thread_is_read_from_the_ticket(backend):
+    asyncio.run(backend.db.tickets.insert_one(legacy_ticket()))
+    try:
+        with client_as(backend, OWNER) as client:
+            ticket = client.get("/api/tickets/t1").json()
+            thread = client.get("/api/tickets/t1/replies").json()
+            listed = client.get("/api/tickets").json()
+    finally:
+        backend.app.dependency_overrides.clear()
+
+    assert [reply["id"] for reply in ticket["replies"]] == ["r1", "r2"]
+    assert [reply["id"] for reply in thread] == ["r1", "r2"]
+    assert (ticket["reply_count"], ticket["last_reply_at"]) == (2, "2025-01-02T00:00:00")
+    assert (listed[0]["reply_count"], listed[0]["last_reply_at"]) == (2, "2025-01-02T00:00:00")
+
+
+def test_reply_to_legacy_ticket_keeps_the_earlier_thread(backend):
+    asyncio.run(backend.db.tickets.insert_one(legacy_ticket()))
+    try:
+        with client_as(backend, OWNER) as client:
+            assert client.post("/api/tickets/t1/reply", json={"message": "Still beeping"}).status_code == 200
+            ticket = client.get("/api/tickets/t1").json()
+    finally:
+        backend.app.dependency_overrides.clear()
+
+    assert ticket["reply_count"] == 3
+    assert [reply["message"] for reply in ticket["replies"]] == ["Which model?", "SunPower 5kW", "Still beeping"]
@@ -0,0 +1,23 @@
+"""Vendors offered for an order (GET /admin/orders/{id}/available-vendors)"""
+import asyncio
+
+
+async def seed(server):
+    for vendor_id, status in (("v1", "approved"), ("v2", "pending"), ("v3", "approved")):
+        await server.db.users.insert_one(
+            {"id": vendor_id, "role": "vendor", "name": vendor_id, "email": f"{vendor_id}@test", "status": status}
+        )
+    for vendor_id, quantity, price in (("v1", 5, 900), ("v2", 5, 100), ("v3", 1, 100)):
+        await server.db.vendor_inventory.insert_one({
+            "id": f"inv-{vendor_id}", "vendor_id": vendor_id, "product_id": "p1",
+            "quantity": quantity, "vendor_price": price, "is_available": True,
+        })
+
+
+def test_only_approved_vendors_with_enough_stock_match(backend):
+    async def run():
+        await seed(backend)
+        order = {"items": [{"product_id": "p1", "quantity": 2}]}
+        return await backend.match_vendors_for_order(order)
+
+    assert [vendor["vendor_id"] for vendor in asyncio.run(run())] == ["v1"]
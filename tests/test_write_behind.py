@@ -0,0 +1,62 @@
+"""Write-behind buffers drained on shutdown (chat history, blog view counts)"""
+import asyncio
+
+
+def slow(collection_class, method: str, monkeypatch, started: asyncio.Event):
+    """Make `method` yield mid-write so stop() lands while a batch is in flight"""
+    original = getattr(collection_class, method)
+
+    async def write(self, *args, **kwargs):
+        started.set()
+        await asyncio.sleep(0.05)
+        return await original(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, method, write)
+
+
+def test_stop_keeps_the_batch_being_written(backend, monkeypatch):
+    buffer = backend.WriteBehindBuffer("chat_history", batch_size=2, flush_interval=60, max_pending=100)
+
+    async def run():
+        started = asyncio.Event()
+        slow(type(backend.db.chat_history), "insert_many", monkeypatch, started)
+        buffer.start()
+        for i in range(3):
+            buffer.add({"id": f"m{i}"})
+        await started.wait()
+        await buffer.stop()
+        return await backend.db.chat_history.count_documents({})
+
+    assert asyncio.run(run()) == 3
+    assert buffer.snapshot()["flushed"] == 3 and buffer.snapshot()["dropped"] == 0
+
+
+def test_buffer_restarts_on_a_new_event_loop(backend):
+    buffer = backend.WriteBehindBuffer("chat_history", batch_size=10, flush_interval=60, max_pending=100)
+
+    async def cycle(doc_id: str):
+        buffer.start()
+        buffer.add({"id": doc_id})
+        await asyncio.sleep(0)  # let the flush task start waiting
+        await buffer.stop()
+
+    asyncio.run(cycle("m1"))
+    asyncio.run(cycle("m2"))
+    assert asyncio.run(backend.db.chat_history.count_documents({})) == 2
+
+
+def test_counter_stop_keeps_the_counts_being_written(backend, monkeypatch):
+    counter = backend.CounterBuffer("blogs", "views", flush_interval=0.01)
+
+    async def run():
+        await backend.db.blogs.insert_one({"id": "b1", "views": 0})
+        started = asyncio.Event()
+        slow(type(backend.db.blogs), "bulk_write", monkeypatch, started)
+        counter.start()
+        for _ in range(3):
+            counter.increment("b1")
+        await started.wait()
+        await counter.stop()
+        return (await backend.db.blogs.find_one({"id": "b1"}))["views"]
+
+    assert asyncio.run(run()) == 3